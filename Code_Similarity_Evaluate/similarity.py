@@ -6,15 +6,24 @@ from tree_sitter import Language, Parser
 from anytree import Node, RenderTree
 from Levenshtein import distance as levenshtein_distance
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Directory paths
 SOURCE_DIR = "0-sourcecode"
 OPTIMIZED_DIR = "fine_grain_final_output2txt"
 
-# Initialize tree-sitter parser
-C_LANGUAGE = Language('tree-sitter-c/build/my-languages.dll', 'c')
+# Metric weights of the overall similarity
+METRIC_WEIGHTS = {
+    'interface': 0.2,
+    'structure': 0.15,
+    'control_flow': 0.2,
+    'halstead': 0.3,
+    'token_edit': 0.15
+}
+
+# Initialize tree-sitter parser, relative to this file so that other scripts can import it
+C_LANGUAGE = Language(os.environ.get('TREE_SITTER_C_LIB',
+                                     os.path.join(CUR_DIR, 'tree-sitter-c', 'build', 'my-languages.dll')), 'c')
 parser = Parser()
 parser.set_language(C_LANGUAGE)
 
@@ -110,15 +119,16 @@ def tree_sitter_to_anytree(node, parent=None):
     return new_node
 
 
+def tree_to_string(tree):
+    root = tree_sitter_to_anytree(tree.root_node)
+    return ''.join(f"{node.name}" for _, _, node in RenderTree(root))
+
+
 def compute_tree_edit_distance(tree1, tree2):
-    root1 = tree_sitter_to_anytree(tree1.root_node)
-    root2 = tree_sitter_to_anytree(tree2.root_node)
+    return structure_similarity(tree_to_string(tree1), tree_to_string(tree2))
 
-    def tree_to_string(tree):
-        return ''.join(f"{node.name}" for _, _, node in RenderTree(tree))
 
-    str1 = tree_to_string(root1)
-    str2 = tree_to_string(root2)
+def structure_similarity(str1, str2):
     max_len = max(len(str1), len(str2))
     if max_len == 0:
         return 1.0
@@ -234,8 +244,10 @@ def extract_tokens(code):
 
 
 def compute_token_edit_distance(code1, code2):
-    tokens1 = extract_tokens(code1)
-    tokens2 = extract_tokens(code2)
+    return token_edit_similarity(extract_tokens(code1), extract_tokens(code2))
+
+
+def token_edit_similarity(tokens1, tokens2):
     edit_dist = levenshtein_distance(tokens1, tokens2)
     max_len = max(len(tokens1), len(tokens2))
     similarity = 1 - (edit_dist / max_len) if max_len > 0 else 1
@@ -249,6 +261,38 @@ def normalize_code(code):
     return code
 
 
+def extract_features(code, metrics=tuple(METRIC_WEIGHTS)):
+    # Per-function inputs of the selected metrics, so that a function compared many times is parsed once
+    code = normalize_code(code)
+    extractors = {
+        'interface': extract_interface,
+        'structure': lambda c: tree_to_string(parse_c_code(c)),
+        'control_flow': extract_control_flow,
+        'halstead': compute_halstead_metrics,
+        'token_edit': extract_tokens
+    }
+    return {metric: extractors[metric](code) for metric in metrics}
+
+
+def compare_features(source_features, test_features, metrics=tuple(METRIC_WEIGHTS)):
+    comparisons = {
+        'interface': interface_similarity,
+        'structure': structure_similarity,
+        'control_flow': control_flow_similarity,
+        'halstead': halstead_similarity,
+        'token_edit': token_edit_similarity
+    }
+    return {metric: comparisons[metric](source_features[metric], test_features[metric]) for metric in metrics}
+
+
+def weighted_similarity(scores):
+    # Overall similarity of a subset of the metrics, with their weights rescaled to sum to 1
+    total = sum(METRIC_WEIGHTS[metric] for metric in scores)
+    if total == 0:
+        return 0
+    return sum(METRIC_WEIGHTS[metric] * score for metric, score in scores.items()) / total
+
+
 def evaluate_function_similarity(source_code, test_code):
     source_code = normalize_code(source_code)
     test_code = normalize_code(test_code)
@@ -265,8 +309,13 @@ def evaluate_function_similarity(source_code, test_code):
     test_halstead = compute_halstead_metrics(test_code)
     halstead_sim = halstead_similarity(source_halstead, test_halstead)
     token_edit_sim = compute_token_edit_distance(source_code, test_code)
-    overall = (0.2 * intf_sim + 0.15 * struct_sim + 0.2 * ctrl_sim +
-               0.3 * halstead_sim + 0.15 * token_edit_sim)
+    overall = weighted_similarity({
+        'interface': intf_sim,
+        'structure': struct_sim,
+        'control_flow': ctrl_sim,
+        'halstead': halstead_sim,
+        'token_edit': token_edit_sim
+    })
     return {
         'interface_similarity': intf_sim,
         'structure_similarity': struct_sim,
@@ -345,6 +394,8 @@ def evaluate_all_files():
 
 
 if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
         evaluate_all_files()
     except Exception as e:
@@ -0,0 +1,292 @@
+import argparse
+from prompt_templates import (create_phase1_optimize_output_with_guidance, create_phase2_optimize_output_with_cfs,
+                              create_phase3_final_recovery)
+from checkpoint_journal import QueryJournal
+from prompt_chunker import CFS_PREFIX
+from telemetry import input_label
+from llm_dispatcher import LLMClient
+from recovery_runner import (load_llm_config, read_and_split_queries, build_client, log_client_stats,
+                             add_common_arguments, recover_code, DEFAULT_CHUNK_TOKENS)
+import os
+import logging
+import queue
+import threading
+import time
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('decompiler_pipeline.log'),
+        logging.StreamHandler()
+    ]
+)
+
+STAGES = [
+    ('step1', create_phase1_optimize_output_with_guidance),
+    ('step2', create_phase2_optimize_output_with_cfs),
+    ('step3', create_phase3_final_recovery),
+]
+# Stage whose input is prefixed with the predicted control flow structure of the function
+CFS_STAGE = 1
+
+
+def read_cfs_hints(cfs_path: str, count: int):
+    """The 'predict control flow:' line of every query of a Phase2 input file, or None if the file does not match."""
+    if not os.path.exists(cfs_path):
+        logging.warning(f"No CFS file {cfs_path}; step2 runs without control flow hints")
+        return None
+    queries = read_and_split_queries(cfs_path)
+    if len(queries) != count:
+        logging.warning(f"{cfs_path} has {len(queries)} queries instead of {count}; "
+                        f"step2 runs without control flow hints")
+        return None
+    return [query.splitlines()[0] if query.startswith(CFS_PREFIX) else None for query in queries]
+
+
+class FileState:
+    """Per-input-file bookkeeping: one journal and one output file per stage."""
+
+    def __init__(self, file_path: str, output_dir: str, resume: bool, cfs_dir: str = None):
+        self.file_name = os.path.basename(file_path)
+        self.input_name = input_label(self.file_name)
+        base_name = os.path.splitext(self.file_name)[0]
+        self.queries = read_and_split_queries(file_path)
+        self.output_paths = [os.path.join(output_dir, f"{base_name}_{step}.txt") for step, _ in STAGES]
+        self.journals = [QueryJournal(os.path.join(output_dir, f"{base_name}_{step}.journal.jsonl"), resume)
+                         for step, _ in STAGES]
+        self.cfs_hints = read_cfs_hints(os.path.join(cfs_dir, self.file_name), len(self.queries)) if cfs_dir else None
+        self.errors = [{} for _ in STAGES]
+        # (idx, query, outputs of the stages already journaled) of every function not through the last stage
+        self.pending = [(idx, query, self._finished_outputs(idx, query))
+                        for idx, query in enumerate(self.queries, 1) if not self.journals[-1].is_done(idx, query)]
+        self.remaining = len(self.pending)
+
+    def _finished_outputs(self, idx: int, query: str) -> list:
+
+        outputs = []
+        for journal in self.journals[:-1]:
+            if not journal.is_done(idx, query):
+                break
+            outputs.append(journal.content(idx))
+        return outputs
+
+    def cfs_hint(self, idx: int):
+
+        return self.cfs_hints[idx - 1] if self.cfs_hints else None
+
+    def record(self, item: dict):
+
+        for stage_no in range(item['resumed'], len(item['outputs'])):
+            self.journals[stage_no].record(item['idx'], item['query'], item['outputs'][stage_no])
+        if item['error'] is not None:
+            failed_stage, message = item['error']
+            for stage_no in range(failed_stage, len(STAGES)):
+                self.errors[stage_no][item['idx']] = f"{STAGES[failed_stage][0]} failed: {message}"
+        self.remaining -= 1
+
+    def finish(self):
+
+        for journal, output_path, errors in zip(self.journals, self.output_paths, self.errors):
+            journal.assemble(output_path, len(self.queries), errors)
+            journal.close()
+        logging.info(f"Finished {self.file_name}: {len(self.queries)} functions")
+
+
+class PipelineStage:
+    """A pool of worker threads applying one prompt template between two bounded queues."""
+
+    def __init__(self, stage_no: int, template, client: LLMClient, in_queue: queue.Queue, out_queue: queue.Queue,
+                 workers: int, downstream_workers: int, chunk_tokens: int = DEFAULT_CHUNK_TOKENS):
+        self.stage_no = stage_no
+        self.template = template
+        self.client = client
+        self.chunk_tokens = chunk_tokens
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.downstream_workers = downstream_workers
+        self._alive = workers
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+
+    def start(self):
+
+        for thread in self.threads:
+            thread.start()
+
+    def _process(self, item: dict):
+
+        step = STAGES[self.stage_no][0]
+        metrics = {'queue_wait': time.monotonic() - item['enqueued']}
+        code = item['outputs'][-1] if item['outputs'] else item['query']
+        hint = item['file'].cfs_hint(item['idx']) if self.stage_no == CFS_STAGE else None
+        if hint:
+            code = f"{hint}\n{code}"
+        try:
+            item['outputs'].append(recover_code(self.client, self.template, code, self.chunk_tokens, metrics))
+        except Exception as e:
+            logging.error(f"{step} failed for query {item['idx']} in {item['file'].file_name}: {str(e)}")
+            item['error'] = (self.stage_no, str(e))
+            metrics['errors'] = 1
+        if self.client.metrics is not None:
+            self.client.metrics.emit(step, item['file'].input_name, item['idx'], metrics)
+
+    def _work(self):
+
+        while True:
+            item = self.in_queue.get()
+            if item is None:
+                break
+
+            # Stages finished by an earlier run were seeded from their journals
+            if item['error'] is None and len(item['outputs']) == self.stage_no:
+                self._process(item)
+            item['enqueued'] = time.monotonic()
+            self.out_queue.put(item)
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            for _ in range(self.downstream_workers):
+                self.out_queue.put(None)
+
+
+def feed_files(file_paths: list, output_dir: str, resume: bool, first_queue: queue.Queue, workers: int,
+               cfs_dir: str = None):
+
+    for file_path in file_paths:
+        try:
+            state = FileState(file_path, output_dir, resume, cfs_dir)
+        except Exception as e:
+            logging.error(f"Failed processing {file_path}: {str(e)}")
+            continue
+
+        if len(state.pending) < len(state.queries):
+            logging.info(f"Skipping {len(state.queries) - len(state.pending)} completed functions in {state.file_name}")
+        if not state.pending:
+            state.finish()
+            continue
+
+        for idx, query, outputs in state.pending:
+            first_queue.put({'file': state, 'idx': idx, 'query': query, 'outputs': outputs, 'resumed': len(outputs),
+                             'error': None, 'started': time.time(), 'enqueued': time.monotonic()})
+
+    for _ in range(workers):
+        first_queue.put(None)
+
+
+def run_pipeline(file_paths: list, output_dir: str, client: LLMClient, max_concurrency: int = 4,
+                 queue_size: int = 16, resume: bool = False, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                 cfs_dir: str = None) -> int:
+    """Stream every function through all STAGES, with each stage connected to the next by a bounded queue.
+
+    The step2 input of a function is prefixed with the 'predict control flow:'
+    line of the same query in cfs_dir/<input file name>, as in the Phase2
+    inputs. Without cfs_dir, or for a file with no matching CFS file, step2
+    runs without control flow hints. With resume, a function restarts at its
+    first stage that has no journal entry.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(STAGES) + 1)]
+    stages = []
+    for stage_no, (_, create_template) in enumerate(STAGES):
+        downstream_workers = max_concurrency if stage_no + 1 < len(STAGES) else 1
+        stages.append(PipelineStage(stage_no, create_template(), client, queues[stage_no], queues[stage_no + 1],
+                                    max_concurrency, downstream_workers, chunk_tokens))
+    for stage in stages:
+        stage.start()
+
+    feeder = threading.Thread(target=feed_files,
+                              args=(file_paths, output_dir, resume, queues[0], max_concurrency, cfs_dir), daemon=True)
+    feeder.start()
+
+    completed = 0
+    while True:
+        item = queues[-1].get()
+        if item is None:
+            break
+        state = item['file']
+        state.record(item)
+        completed += 1
+        logging.info(f"Function {item['idx']}/{len(state.queries)} of {state.file_name} through "
+                     f"{len(item['outputs'])}/{len(STAGES)} stages in {time.time() - item['started']:.1f}s")
+        if state.remaining == 0:
+            state.finish()
+
+    feeder.join()
+    return completed
+
+
+def main():
+
+    try:
+        llm_config = load_llm_config()
+    except Exception as e:
+        logging.critical("Failed to initialize configuration, exiting...")
+        return
+
+
+    parser = argparse.ArgumentParser(
+        description="AI Decompiler Assistant - Pipelined Phase 1 -> 2 -> 3 Recovery",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--input_dir',
+        type=str,
+        default=os.path.join(os.getcwd(), 'Phase1_Decompiled_code_with_guidance'),
+        help="Input directory containing phase1 processed files"
+    )
+    parser.add_argument(
+        '--output_dir',
+        type=str,
+        default=os.path.join(os.getcwd(), 'Pipeline_recovery_output'),
+        help="Output directory for the step1/step2/step3 results"
+    )
+    parser.add_argument(
+        '--cfs_dir',
+        type=str,
+        default=os.path.join(os.getcwd(), 'Phase2_Decompiled_code_with_CFS'),
+        help="Directory of Phase2 input files whose 'predict control flow:' lines are passed to step2 "
+             "(empty string to run step2 without control flow hints)"
+    )
+    parser.add_argument(
+        '--queue_size',
+        type=int,
+        default=16,
+        help="Capacity of the queue between two consecutive stages"
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    if args.batch_size != 1:
+        # Functions move through the stages one at a time, so there is nothing to batch
+        parser.error("--batch_size is only supported by the Phase*.py scripts, not by the pipeline")
+
+
+    try:
+        client = build_client(llm_config, args)
+    except Exception as e:
+        logging.critical(f"LLM initialization failed: {str(e)}")
+        return
+
+
+    if not os.path.exists(args.input_dir):
+        logging.critical(f"Input directory not found: {args.input_dir}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+
+    file_paths = [os.path.join(root, file)
+                  for root, _, files in os.walk(args.input_dir) for file in sorted(files) if file.endswith('.txt')]
+
+    start = time.time()
+    completed = run_pipeline(file_paths, args.output_dir, client, args.max_concurrency, args.queue_size,
+                             args.resume, args.chunk_tokens, args.cfs_dir)
+    logging.info(f"Pipeline completed. {completed} functions from {len(file_paths)} files "
+                 f"in {time.time() - start:.1f}s.")
+    log_client_stats(client)
+
+
+if __name__ == "__main__":
+    main()
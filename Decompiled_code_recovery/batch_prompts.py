@@ -0,0 +1,46 @@
+import re
+
+
+BEGIN_MARKER = "### FUNCTION {idx} BEGIN"
+END_MARKER = "### FUNCTION {idx} END"
+BLOCK_PATTERN = re.compile(r'^### FUNCTION (\d+) BEGIN[ \t]*\n(.*?)\n?^### FUNCTION \1 END[ \t]*$',
+                           re.DOTALL | re.MULTILINE)
+FENCE_PATTERN = re.compile(r'^\s*```[\w+]*\s*\n(.*?)\n\s*```\s*$', re.DOTALL)
+
+BATCH_INSTRUCTIONS = """The input below contains {count} independent functions. Each one is enclosed between a "### FUNCTION k BEGIN" line and a "### FUNCTION k END" line.
+Apply the instructions above to every function separately. Reply with the result for function k enclosed between the same "### FUNCTION k BEGIN" and "### FUNCTION k END" lines, for k = 1..{count} in order, and write nothing outside these markers.
+"""
+
+
+class BatchParseError(ValueError):
+    pass
+
+
+def build_batch_code(functions: list) -> str:
+    """Combine several functions into one {code} value, each wrapped in numbered markers."""
+    parts = [BATCH_INSTRUCTIONS.format(count=len(functions))]
+    for idx, code in enumerate(functions, 1):
+        parts.append(f"{BEGIN_MARKER.format(idx=idx)}\n{code.strip()}\n{END_MARKER.format(idx=idx)}")
+    return "\n".join(parts)
+
+
+def parse_batch_response(response: str, count: int) -> list:
+    """Split a batched reply back into count per-function outputs.
+
+    Raises BatchParseError unless every function 1..count appears exactly once.
+    """
+    blocks = {}
+    for match in BLOCK_PATTERN.finditer(response):
+        idx = int(match.group(1))
+        if idx in blocks:
+            raise BatchParseError(f"function {idx} appears more than once")
+        content = match.group(2).strip()
+        fenced = FENCE_PATTERN.match(content)
+        blocks[idx] = (fenced.group(1) if fenced else content).strip()
+
+    missing = [idx for idx in range(1, count + 1) if not blocks.get(idx)]
+    if missing:
+        raise BatchParseError(f"missing or empty output for functions {missing}")
+    if len(blocks) != count:
+        raise BatchParseError(f"expected {count} functions, got {len(blocks)}")
+    return [blocks[idx] for idx in range(1, count + 1)]
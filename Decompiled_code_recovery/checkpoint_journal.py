@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+import os
+
+
+def query_digest(query: str) -> str:
+
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class QueryJournal:
+    """Append-only JSONL journal of the completed queries of one input file.
+
+    Each completed response is written as soon as it arrives. Only the offset
+    of every entry is kept in memory, and the final output is assembled from
+    the journal, so long runs can restart from the last completed query.
+    """
+
+    def __init__(self, journal_path: str, resume: bool = False):
+        self.journal_path = journal_path
+        self._offsets = {}
+        self._digests = {}
+
+        if resume and os.path.exists(journal_path):
+            self._load()
+        elif os.path.exists(journal_path):
+            os.remove(journal_path)
+
+        self._file = open(journal_path, 'a', encoding='utf-8', newline='\n')
+
+    def _load(self):
+
+        with open(self.journal_path, 'rb+') as f:
+            offset = f.tell()
+            for line in iter(f.readline, b''):
+                if not line.endswith(b'\n'):
+                    # The previous run died mid-write; drop the partial entry
+                    f.truncate(offset)
+                    break
+                try:
+                    entry = json.loads(line)
+                    self._offsets[entry['idx']] = offset
+                    self._digests[entry['idx']] = entry['query_sha']
+                except (ValueError, KeyError):
+                    logging.warning(f"Skipping damaged journal entry at byte {offset} in {self.journal_path}")
+                offset = f.tell()
+        logging.info(f"Resuming from {self.journal_path}: {len(self._offsets)} queries already completed")
+
+    def is_done(self, idx: int, query: str) -> bool:
+
+        return self._digests.get(idx) == query_digest(query)
+
+    def content(self, idx: int) -> str:
+        """Recorded response of query idx, read back from the journal."""
+        self._file.flush()
+        with open(self.journal_path, 'rb') as journal:
+            journal.seek(self._offsets[idx])
+            return json.loads(journal.readline())['content']
+
+    def record(self, idx: int, query: str, content: str):
+
+        line = json.dumps({'idx': idx, 'query_sha': query_digest(query), 'content': content}, ensure_ascii=False)
+        self._file.flush()
+        self._offsets[idx] = os.path.getsize(self.journal_path)
+        self._digests[idx] = query_digest(query)
+        self._file.write(line + '\n')
+        self._file.flush()
+
+    def assemble(self, output_path: str, total: int, errors: dict):
+        """Write the Query 1..total blocks in order, reading each response back from the journal."""
+        self._file.flush()
+        with open(self.journal_path, 'rb') as journal, \
+                open(output_path, 'w', encoding='utf-8') as out:
+            for idx in range(1, total + 1):
+                if idx > 1:
+                    out.write("\n/////\n")
+                if idx in self._offsets:
+                    journal.seek(self._offsets[idx])
+                    out.write(f"Query {idx}:\n{json.loads(journal.readline())['content']}\n")
+                else:
+                    out.write(f"Query {idx}:\n[ERROR] {errors.get(idx, 'no response recorded')}\n")
+
+    def close(self):
+
+        self._file.close()
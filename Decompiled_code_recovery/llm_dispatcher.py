@@ -0,0 +1,100 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from langchain.schema import HumanMessage
+from rate_limiter import call_with_retry, estimate_tokens
+from stream_extractor import stream_until_code
+from telemetry import add_metric
+
+
+def invoke_prompt(llm, prompt: str, cache=None, limiter=None, max_retries: int = 0, stream: bool = False,
+                  metrics: dict = None, batch: int = 1) -> str:
+    """Send one prompt through the cache, rate limiter and retry policy.
+
+    batch is the number of functions in a batched prompt; a streamed reply
+    to it is only cut after the last function's end marker.
+
+    When a metrics dict is given, the call adds its requests, cache hits,
+    throttle wait, latency, retries and prompt/completion tokens to it.
+    """
+    add_metric(metrics, 'requests', 1)
+    if cache is not None:
+        cached = cache.get(prompt)
+        if cached is not None:
+            add_metric(metrics, 'cache_hits', 1)
+            return cached
+
+    estimated = estimate_tokens(prompt)
+    messages = [HumanMessage(content=prompt)]
+
+    def call():
+        if limiter is not None:
+            add_metric(metrics, 'throttle_wait', limiter.acquire(estimated))
+        if stream:
+            content, usage, _ = stream_until_code(llm, messages, batch)
+            return content, usage
+        response = llm.invoke(messages)
+        return response.content.strip(), getattr(response, 'usage_metadata', None)
+
+    start = time.monotonic()
+    (content, usage), retries = call_with_retry(call, max_retries, limiter=limiter)
+    usage = usage or {}
+    prompt_tokens = usage.get('input_tokens', estimated)
+    completion_tokens = usage.get('output_tokens', estimate_tokens(content))
+    add_metric(metrics, 'latency', time.monotonic() - start)
+    add_metric(metrics, 'retries', retries)
+    add_metric(metrics, 'prompt_tokens', prompt_tokens)
+    add_metric(metrics, 'completion_tokens', completion_tokens)
+
+    if limiter is not None:
+        limiter.on_success(estimated, usage.get('total_tokens', prompt_tokens + completion_tokens))
+    if cache is not None:
+        cache.put(prompt, content)
+    return content
+
+
+class LLMClient:
+    """An LLM together with the response cache, rate limiter and retry policy applied to every call.
+
+    metrics is an optional telemetry.MetricsSink receiving one record per query.
+    """
+
+    def __init__(self, llm, cache=None, limiter=None, max_retries: int = 0, stream: bool = False, metrics=None):
+        self.llm = llm
+        self.cache = cache
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.stream = stream
+        self.metrics = metrics
+        self.model_name = getattr(llm, 'model_name', '')
+
+    def invoke(self, prompt: str, metrics: dict = None, batch: int = 1) -> str:
+
+        return invoke_prompt(self.llm, prompt, self.cache, self.limiter, self.max_retries, self.stream, metrics,
+                             batch)
+
+
+def dispatch_queries(call, items, max_concurrency: int = 4):
+    """Run call(item) for every item with at most max_concurrency calls in flight.
+
+    Yields (idx, result, error) as each call completes, idx being the 1-based
+    position of the item, so callers can restore the original Query N order.
+    """
+    max_concurrency = max(1, int(max_concurrency))
+    pending_items = enumerate(items, 1)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        in_flight = {}
+        for idx, item in islice(pending_items, max_concurrency):
+            in_flight[executor.submit(call, item)] = idx
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = in_flight.pop(future)
+                for next_idx, next_item in islice(pending_items, 1):
+                    in_flight[executor.submit(call, next_item)] = next_idx
+                try:
+                    yield idx, future.result(), None
+                except Exception as e:
+                    yield idx, None, e
@@ -0,0 +1,270 @@
+import functools
+import logging
+import os
+import sys
+from rate_limiter import estimate_tokens
+
+
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+LIBRARY_SUFFIX = {'win32': '.dll', 'cygwin': '.dll', 'darwin': '.dylib'}.get(sys.platform, '.so')
+TREE_SITTER_C_LIB = os.environ.get(
+    'TREE_SITTER_C_LIB',
+    os.path.join(CUR_DIR, '..', 'Code_Similarity_Evaluate', 'tree-sitter-c', 'build', 'my-languages' + LIBRARY_SUFFIX)
+)
+# First line of a Phase2 query; it is repeated in every chunk of a split query
+CFS_PREFIX = 'predict control flow:'
+
+STATEMENT_TYPES = (
+    'function_definition', 'declaration', 'expression_statement', 'return_statement', 'if_statement',
+    'for_statement', 'while_statement', 'do_statement', 'switch_statement', 'case_statement',
+    'break_statement', 'continue_statement', 'goto_statement', 'labeled_statement', 'compound_statement',
+    'comment', 'preproc_include', 'preproc_def', 'type_definition', 'struct_specifier'
+)
+
+
+class TokenCounter:
+    """Counts tokens with the model's tiktoken encoding, or estimates them when tiktoken is unavailable."""
+
+    def __init__(self, model: str = ''):
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding('cl100k_base')
+        except ImportError:
+            logging.info("tiktoken not installed, estimating token counts from text length")
+
+    def count(self, text: str) -> int:
+
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def split(self, text: str, max_tokens: int) -> list:
+        """Cut text into consecutive pieces of at most max_tokens tokens, regardless of its content."""
+        if self.encoding is None:
+            step = max_tokens * 4
+            return [text[start:start + step] for start in range(0, len(text), step)]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        pieces = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + max_tokens, len(tokens))
+            # Keep a character whose bytes span two tokens whole: move the cut back, or forward if it cannot
+            while end > start + 1 and self._decode(tokens[start:end]) is None:
+                end -= 1
+            while end < len(tokens) and self._decode(tokens[start:end]) is None:
+                end += 1
+            pieces.append(self._decode(tokens[start:end]) or '')
+            start = end
+        return pieces
+
+    def _decode(self, tokens: list):
+
+        try:
+            return b''.join(self.encoding.decode_single_token_bytes(token) for token in tokens).decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_token_counter(model: str = '') -> TokenCounter:
+
+    return TokenCounter(model)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_parser():
+
+    try:
+        from tree_sitter import Language, Parser
+        parser = Parser()
+        parser.set_language(Language(TREE_SITTER_C_LIB, 'c'))
+        return parser
+    except Exception as e:
+        logging.warning(f"tree-sitter C grammar {TREE_SITTER_C_LIB} unavailable ({e}), "
+                        f"using lexical statement boundaries; set TREE_SITTER_C_LIB to a built grammar")
+        return None
+
+
+def _tree_sitter_cuts(code: str, parser) -> list:
+
+    data = code.encode('utf-8')
+    if len(data) == len(code):
+        to_char = lambda b: b
+    else:
+        offsets = [0] * (len(data) + 1)
+        pos = 0
+        for i, ch in enumerate(code):
+            for _ in range(len(ch.encode('utf-8'))):
+                pos += 1
+                offsets[pos] = i + 1
+        to_char = lambda b: offsets[b]
+
+    cuts = []
+
+    def traverse(node, depth):
+        if node.type in STATEMENT_TYPES:
+            cuts.append((to_char(node.end_byte), depth))
+        if node.type == 'compound_statement':
+            depth += 1
+            if node.children and node.children[0].type == '{':
+                cuts.append((to_char(node.children[0].end_byte), depth))
+        for child in node.children:
+            traverse(child, depth)
+
+    traverse(parser.parse(data).root_node, 0)
+    return cuts
+
+
+def _lexical_cuts(code: str) -> list:
+    """Statement ends (';', '{', '}') outside comments and literals, with their brace depth."""
+    cuts = []
+    depth = 0
+    i = 0
+    n = len(code)
+    while i < n:
+        ch = code[i]
+        if code.startswith('//', i):
+            i = code.find('\n', i)
+            if i < 0:
+                break
+            cuts.append((i, depth))
+            continue
+        if code.startswith('/*', i):
+            end = code.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch in '"\'':
+            i += 1
+            while i < n and code[i] != ch:
+                i += 2 if code[i] == '\\' else 1
+        elif ch == '{':
+            depth += 1
+            cuts.append((i + 1, depth))
+        elif ch == '}':
+            depth = max(0, depth - 1)
+            cuts.append((i + 1, depth))
+        elif ch == ';':
+            cuts.append((i + 1, depth))
+        i += 1
+    return cuts
+
+
+def statement_boundaries(code: str) -> list:
+    """Positions where code can be split without cutting a statement, as sorted (pos, depth) pairs."""
+    parser = _get_parser()
+    cuts = _tree_sitter_cuts(code, parser) if parser is not None else _lexical_cuts(code)
+    best = {}
+    for pos, depth in cuts:
+        if 0 < pos < len(code):
+            best[pos] = min(depth, best.get(pos, depth))
+    return sorted(best.items()) + [(len(code), 0)]
+
+
+def _split_lines(text: str, max_tokens: int, counter: TokenCounter) -> list:
+
+    chunks, current, current_tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        tokens = counter.count(line)
+        if tokens > max_tokens:
+            # Last resort for a line with no statement boundary: cut it on token boundaries
+            if current:
+                chunks.append(''.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(counter.split(line, max_tokens))
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def chunk_code(code: str, max_tokens: int, counter: TokenCounter = None) -> list:
+    """Split code into pieces of at most max_tokens tokens at statement boundaries.
+
+    Among the boundaries that fit, the shallowest one in the second half of
+    the budget is preferred, so chunks end on whole top-level statements
+    whenever possible. A line with no boundary that is still too long is cut
+    on token boundaries. The 'predict control flow:' line of a Phase2 query
+    is repeated at the top of every chunk. Code that already fits is
+    returned unchanged.
+    """
+    counter = counter or get_token_counter()
+    if max_tokens <= 0 or counter.count(code) <= max_tokens:
+        return [code]
+
+    if code.startswith(CFS_PREFIX):
+        header, _, body = code.partition('\n')
+        budget = max(1, max_tokens - counter.count(header + '\n'))
+        return [f"{header}\n{chunk}" for chunk in chunk_code(body, budget, counter)]
+
+    boundaries = statement_boundaries(code)
+    segments = []
+    start = 0
+    for pos, depth in boundaries:
+        segments.append((code[start:pos], depth))
+        start = pos
+    sizes = [counter.count(text) for text, _ in segments]
+
+    chunks = []
+    i = 0
+    while i < len(segments):
+        if sizes[i] > max_tokens:
+            chunks.extend(_split_lines(segments[i][0], max_tokens, counter))
+            i += 1
+            continue
+
+        total = 0
+        best_j, best_depth = i, None
+        j = i
+        while j < len(segments) and total + sizes[j] <= max_tokens:
+            total += sizes[j]
+            depth = segments[j][1]
+            if total >= max_tokens // 2 and (best_depth is None or depth <= best_depth):
+                best_j, best_depth = j, depth
+            j += 1
+        if best_depth is None:
+            best_j = j - 1
+
+        # Token counts are not exactly additive across segment joins. When the chunk
+        # overshoots, back off to the shallowest earlier boundary that fits, the latest among equals
+        chunk = ''.join(text for text, _ in segments[i:best_j + 1])
+        if best_j > i and counter.count(chunk) > max_tokens:
+            for j in sorted(range(i, best_j), key=lambda k: (segments[k][1], -k)):
+                chunk = ''.join(text for text, _ in segments[i:j + 1])
+                if j == i or counter.count(chunk) <= max_tokens:
+                    best_j = j
+                    break
+
+        chunks.append(chunk)
+        i = best_j + 1
+
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def pack_queries(queries: list, max_tokens: int, counter: TokenCounter = None, max_items: int = 0) -> list:
+    """Group consecutive small queries whose combined size fits in max_tokens.
+
+    Returns lists of 0-based query positions; a query that does not fit on
+    its own forms a group by itself.
+    """
+    counter = counter or get_token_counter()
+    groups, current, current_tokens = [], [], 0
+    for pos, query in enumerate(queries):
+        tokens = counter.count(query)
+        full = max_items and len(current) >= max_items
+        if current and (full or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(pos)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
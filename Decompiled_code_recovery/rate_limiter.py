@@ -0,0 +1,175 @@
+import collections
+import logging
+import random
+import threading
+import time
+
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+RETRYABLE_ERRORS = ('RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError',
+                    'TimeoutException', 'ConnectError', 'ReadTimeout', 'RemoteProtocolError')
+
+
+def estimate_tokens(text: str) -> int:
+
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute of tokens."""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_minute = float(rate_per_minute)
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until amount tokens are available and take them. Returns the time spent waiting."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) * 60.0 / self.rate_per_minute
+            time.sleep(delay)
+            waited += delay
+
+    def debit(self, amount: float):
+        """Take tokens without waiting; the balance may go negative and delays later callers."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+    def set_rate(self, rate_per_minute: float):
+        """Change the refill rate; the capacity follows it, so a lowered rate cannot be exceeded in a burst."""
+        with self._lock:
+            self._refill()
+            self.rate_per_minute = float(rate_per_minute)
+            self.capacity = float(rate_per_minute)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """Requests/min and tokens/min limits with additive-increase, multiplicative-decrease on 429s.
+
+    The effective rate starts at the configured limits, is halved on every
+    rate-limit response and creeps back up after each success, so the
+    dispatcher settles just below what the provider actually accepts.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, min_fraction: float = 0.1, window: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.min_fraction = min_fraction
+        self.fraction = 1.0
+        self.window = window
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.rate_limited = 0
+        self._completed = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int) -> float:
+
+        waited = 0.0
+        if self.request_bucket is not None:
+            waited += self.request_bucket.acquire(1)
+        if self.token_bucket is not None:
+            waited += self.token_bucket.acquire(estimated_tokens)
+        return waited
+
+    def _apply_fraction(self):
+
+        if self.request_bucket is not None:
+            self.request_bucket.set_rate(self.rpm * self.fraction)
+        if self.token_bucket is not None:
+            self.token_bucket.set_rate(self.tpm * self.fraction)
+
+    def on_success(self, estimated_tokens: int, used_tokens: int):
+
+        if self.token_bucket is not None and used_tokens > estimated_tokens:
+            self.token_bucket.debit(used_tokens - estimated_tokens)
+        with self._lock:
+            now = time.monotonic()
+            self._completed.append((now, used_tokens))
+            while self._completed and self._completed[0][0] < now - self.window:
+                self._completed.popleft()
+            if self.fraction < 1.0:
+                self.fraction = min(1.0, self.fraction + 0.02)
+                self._apply_fraction()
+
+    def on_rate_limited(self):
+
+        with self._lock:
+            self.rate_limited += 1
+            self.fraction = max(self.min_fraction, self.fraction / 2)
+            self._apply_fraction()
+        logging.warning(f"Rate limited by the endpoint, throttling to {self.fraction:.0%} of the configured limits")
+
+    def throughput(self) -> dict:
+        """Requests and tokens per minute completed over the last window."""
+        with self._lock:
+            now = time.monotonic()
+            recent = [(t, n) for t, n in self._completed if t >= now - self.window]
+        scale = 60.0 / self.window
+        return {
+            'requests_per_min': len(recent) * scale,
+            'tokens_per_min': sum(n for _, n in recent) * scale,
+            'rate_fraction': self.fraction,
+            'rate_limited': self.rate_limited
+        }
+
+
+def is_retryable(error: Exception) -> bool:
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if getattr(error, 'status_code', None) in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def is_rate_limit(error: Exception) -> bool:
+
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def retry_after(error: Exception) -> float:
+
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after', 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def call_with_retry(call, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0,
+                    limiter: AdaptiveRateLimiter = None):
+    """Run call(), retrying retryable failures with full-jitter exponential backoff.
+
+    Returns (result, retries).
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return call(), attempt
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            if limiter is not None and is_rate_limit(e):
+                limiter.on_rate_limited()
+            delay = max(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)), retry_after(e))
+            logging.warning(f"Retrying after {type(e).__name__} in {delay:.1f}s "
+                            f"(attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
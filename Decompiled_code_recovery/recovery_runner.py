@@ -0,0 +1,411 @@
+import argparse
+import configparser
+import logging
+import os
+import threading
+import time
+import httpx
+from langchain_openai import ChatOpenAI
+from llm_dispatcher import dispatch_queries, LLMClient
+from response_cache import ResponseCache
+from checkpoint_journal import QueryJournal
+from rate_limiter import AdaptiveRateLimiter
+from prompt_chunker import chunk_code, pack_queries, get_token_counter
+from batch_prompts import build_batch_code, parse_batch_response
+from telemetry import MetricsSink, format_report, input_label
+
+
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(CUR_DIR, 'DeepSeek_config.ini')
+DEFAULT_CACHE_PATH = os.path.join(CUR_DIR, 'llm_response_cache.sqlite')
+DEFAULT_CHUNK_TOKENS = 8000
+DEFAULT_MAX_RETRIES = 3
+
+_llm_lock = threading.Lock()
+_shared_llm = None
+
+
+def load_llm_config(config_file: str = CONFIG_FILE) -> dict:
+
+    required_keys = ['model', 'temperature', 'api_key', 'api_base']
+
+    try:
+        config = configparser.ConfigParser()
+        if not config.read(config_file):
+            raise FileNotFoundError(f"Config file {config_file} not found")
+
+        if 'LLM' not in config:
+            raise KeyError("Missing [LLM] section in config file")
+
+        llm_config = dict(config['LLM'])
+
+        missing = [k for k in required_keys if k not in llm_config]
+        if missing:
+            raise ValueError(f"Missing required keys: {missing}")
+
+        llm_config['temperature'] = float(llm_config['temperature'])
+        for key in ('rpm', 'tpm'):
+            llm_config[key] = float(llm_config.get(key) or 0)
+
+        return llm_config
+
+    except Exception as e:
+        logging.error(f"Config loading failed: {str(e)}")
+        raise
+
+
+def read_and_split_queries(file_path: str) -> list:
+
+    logging.info(f"Reading and splitting queries from {file_path}")
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return [q.strip() for q in f.read().split('/////') if q.strip()]
+    except UnicodeDecodeError:
+        logging.error(f"Encoding error in {file_path}, trying gb2312...")
+        with open(file_path, 'r', encoding='gb2312') as f:
+            return [q.strip() for q in f.read().split('/////') if q.strip()]
+
+
+def get_llm(llm_config: dict = None, pool_size: int = 16) -> ChatOpenAI:
+    """Return the process-wide LLM client, creating it on first use.
+
+    All phases running in one process share this client and its pooled,
+    keep-alive HTTP connections.
+    """
+    global _shared_llm
+
+    with _llm_lock:
+        if _shared_llm is None:
+            llm_config = llm_config or load_llm_config()
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                timeout=httpx.Timeout(600.0, connect=10.0)
+            )
+            _shared_llm = ChatOpenAI(
+                model=llm_config['model'],
+                temperature=llm_config['temperature'],
+                openai_api_key=llm_config['api_key'],
+                openai_api_base=llm_config['api_base'],
+                http_client=http_client,
+                max_retries=0
+            )
+            logging.info(f"LLM initialized: {llm_config['model']} @ {llm_config['api_base']}")
+        return _shared_llm
+
+
+def open_cache(llm_config: dict, cache_path: str = DEFAULT_CACHE_PATH, cache_max_mb: int = 512,
+               stream: bool = False) -> ResponseCache:
+
+    model_params = {'model': llm_config['model'], 'temperature': llm_config['temperature']}
+    if stream:
+        # Streamed replies are cut after the code, so they must not be served to non-streaming runs
+        model_params['stream'] = True
+    cache = ResponseCache(
+        cache_path,
+        model_params,
+        max_bytes=cache_max_mb * 1024 * 1024
+    )
+    logging.info(f"Response cache enabled: {cache_path}")
+    return cache
+
+
+def build_limiter(llm_config: dict, rpm: float = None, tpm: float = None) -> AdaptiveRateLimiter:
+    """Rate limiter with the given limits, falling back to rpm/tpm of the [LLM] config section."""
+    rpm = llm_config.get('rpm', 0) if rpm is None else rpm
+    tpm = llm_config.get('tpm', 0) if tpm is None else tpm
+    if not rpm and not tpm:
+        logging.warning("No rpm/tpm limit configured (--rpm/--tpm or the [LLM] section); requests are not paced")
+    return AdaptiveRateLimiter(rpm, tpm)
+
+
+def build_client(llm_config: dict, args: argparse.Namespace) -> LLMClient:
+    """Assemble the shared LLM client with the cache, rate limiter and retry settings from the command line."""
+    cache = None if args.no_cache else open_cache(llm_config, args.cache_path, args.cache_max_mb, args.stream)
+    metrics = None
+    if args.metrics_path or args.prometheus_path:
+        metrics = MetricsSink(args.metrics_path, args.prometheus_path)
+        logging.info(f"Per-query metrics enabled: {args.metrics_path or args.prometheus_path}")
+    return LLMClient(get_llm(llm_config), cache, build_limiter(llm_config, args.rpm, args.tpm), args.max_retries,
+                     args.stream, metrics)
+
+
+def log_client_stats(client: LLMClient):
+
+    stats = client.limiter.throughput()
+    logging.info(f"Throughput over the last minute: {stats['requests_per_min']:.1f} requests/min, "
+                 f"{stats['tokens_per_min']:.0f} tokens/min, {stats['rate_limited']} rate-limit responses")
+    if client.cache is not None:
+        stats = client.cache.stats()
+        logging.info(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['entries']} entries ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+        client.cache.close()
+    if client.metrics is not None:
+        summary = client.metrics.close()
+        if summary:
+            logging.info("Per-query latency summary:\n" + format_report(summary))
+
+
+def recover_code(client: LLMClient, template, code: str, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                 metrics: dict = None) -> str:
+    """Send code through template, splitting it at statement boundaries when it exceeds chunk_tokens."""
+    chunks = chunk_code(code, chunk_tokens, get_token_counter(client.model_name))
+    if len(chunks) > 1:
+        logging.info(f"Split oversized query into {len(chunks)} chunks of at most {chunk_tokens} tokens")
+    return "\n".join(client.invoke(template.format(code=chunk), metrics) for chunk in chunks)
+
+
+def run_phase(template, inputs, client: LLMClient = None, max_concurrency: int = 4, ordered: bool = False,
+              chunk_tokens: int = DEFAULT_CHUNK_TOKENS, batch_size: int = 1, labels: dict = None):
+    """Format every input with template and send it to the LLM.
+
+    Yields (idx, content, error) with a 1-based idx, in completion order, or
+    in input order when ordered is True. With batch_size > 1, up to that many
+    small consecutive inputs share one delimited prompt; a batch whose reply
+    cannot be parsed is retried as single-function calls.
+
+    When the client has a metrics sink, one record per input is emitted with
+    the phase and input names from labels; the calls of a batch are shared
+    evenly between its functions.
+    """
+    if client is None:
+        # The shared ChatOpenAI does not retry on its own, so the default client must
+        llm_config = load_llm_config()
+        client = LLMClient(get_llm(llm_config), limiter=build_limiter(llm_config), max_retries=DEFAULT_MAX_RETRIES)
+    inputs = list(inputs)
+    if batch_size > 1:
+        counter = get_token_counter(client.model_name)
+        groups = pack_queries(inputs, chunk_tokens or float('inf'), counter, batch_size)
+    else:
+        groups = [[pos] for pos in range(len(inputs))]
+
+    labels = labels or {}
+    ready = time.monotonic()
+
+    def run_single(code, metrics):
+        try:
+            return recover_code(client, template, code, chunk_tokens, metrics), None
+        except Exception as e:
+            return None, e
+
+    def run_group(group):
+        metrics = {'queue_wait': time.monotonic() - ready}
+        codes = [inputs[pos] for pos in group]
+        outputs = None
+        if len(codes) > 1:
+            try:
+                response = client.invoke(template.format(code=build_batch_code(codes)), metrics, len(codes))
+                outputs = [(content, None) for content in parse_batch_response(response, len(codes))]
+            except Exception as e:
+                logging.warning(f"Batch of {len(codes)} functions failed ({str(e)}), "
+                                f"falling back to single-function calls")
+        outputs = outputs or [run_single(code, metrics) for code in codes]
+        if client.metrics is not None:
+            emit_metrics(group, outputs, metrics)
+        return outputs
+
+    def emit_metrics(group, outputs, metrics):
+        if len(group) > 1:
+            metrics = {key: value if key == 'queue_wait' else value / len(group) for key, value in metrics.items()}
+        for pos, (_, error) in zip(group, outputs):
+            client.metrics.emit(labels.get('phase', ''), labels.get('input', ''), pos + 1,
+                                dict(metrics, errors=int(error is not None)), batch=len(group))
+
+    def results():
+        for group_idx, outputs, error in dispatch_queries(run_group, groups, max_concurrency):
+            group = groups[group_idx - 1]
+            for pos, (content, single_error) in zip(group, outputs or [(None, error)] * len(group)):
+                yield pos + 1, content, single_error
+
+    if not ordered:
+        yield from results()
+        return
+
+    buffered = {}
+    next_idx = 1
+    for idx, content, error in results():
+        buffered[idx] = (idx, content, error)
+        while next_idx in buffered:
+            yield buffered.pop(next_idx)
+            next_idx += 1
+
+
+def process_file(file_path: str, output_dir: str, template, step: str, client: LLMClient = None,
+                 max_concurrency: int = 4, resume: bool = False, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                 batch_size: int = 1):
+
+    try:
+        queries = read_and_split_queries(file_path)
+        file_name = os.path.basename(file_path)
+        base_name = os.path.splitext(file_name)[0]
+        output_path = os.path.join(output_dir, f"{base_name}_{step}.txt")
+        journal = QueryJournal(os.path.join(output_dir, f"{base_name}_{step}.journal.jsonl"), resume)
+
+        pending = [(idx, query) for idx, query in enumerate(queries, 1) if not journal.is_done(idx, query)]
+        if len(pending) < len(queries):
+            logging.info(f"Skipping {len(queries) - len(pending)} completed queries in {file_name}")
+        errors = {}
+
+        inputs = [query for _, query in pending]
+        labels = {'phase': step, 'input': input_label(file_name)}
+        for pos, content, error in run_phase(template, inputs, client, max_concurrency,
+                                             chunk_tokens=chunk_tokens, batch_size=batch_size, labels=labels):
+            idx, query = pending[pos - 1]
+            if error is None:
+                logging.info(f"Finished query {idx}/{len(queries)} in {file_name}")
+                journal.record(idx, query, content)
+            else:
+                logging.error(f"Failed processing query {idx}: {str(error)}")
+                errors[idx] = str(error)
+
+        journal.assemble(output_path, len(queries), errors)
+        journal.close()
+
+    except Exception as e:
+        logging.error(f"Fatal error processing {file_path}: {str(e)}")
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+
+    parser.add_argument(
+        '--max_concurrency',
+        type=int,
+        default=4,
+        help="Maximum number of LLM requests in flight at once"
+    )
+    parser.add_argument(
+        '--cache_path',
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file used to cache LLM responses across runs"
+    )
+    parser.add_argument(
+        '--cache_max_mb',
+        type=int,
+        default=512,
+        help="Maximum size of cached responses before LRU eviction"
+    )
+    parser.add_argument(
+        '--no_cache',
+        action='store_true',
+        help="Always query the LLM and do not read or write the response cache"
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Skip queries already recorded in the output journal of a previous run"
+    )
+    parser.add_argument(
+        '--rpm',
+        type=float,
+        default=None,
+        help="Requests per minute allowed by the endpoint (default: rpm in the config file; 0 disables the limit)"
+    )
+    parser.add_argument(
+        '--tpm',
+        type=float,
+        default=None,
+        help="Tokens per minute allowed by the endpoint (default: tpm in the config file; 0 disables the limit)"
+    )
+    parser.add_argument(
+        '--max_retries',
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help="Retries with jittered exponential backoff for 429s, timeouts and 5xx errors"
+    )
+    parser.add_argument(
+        '--chunk_tokens',
+        type=int,
+        default=DEFAULT_CHUNK_TOKENS,
+        help="Split functions longer than this many tokens at statement boundaries (0 disables splitting)"
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=1,
+        help="Send up to this many small functions in one delimited prompt (1 disables batching)"
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help="Stream completions and stop each one as soon as the recovered code block is complete"
+    )
+    parser.add_argument(
+        '--metrics_path',
+        type=str,
+        default=None,
+        help="Append per-query latency, token, retry and cache metrics to this JSONL file"
+    )
+    parser.add_argument(
+        '--prometheus_path',
+        type=str,
+        default=None,
+        help="Write a Prometheus text-format summary of the per-query metrics here at the end of the run"
+    )
+
+
+def run_phase_main(phase_name: str, description: str, create_template, step: str, input_dir: str,
+                   output_dir: str):
+    """Command-line entry point shared by the Phase*.py scripts."""
+    try:
+        llm_config = load_llm_config()
+    except Exception as e:
+        logging.critical("Failed to initialize configuration, exiting...")
+        return
+
+    parser = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        '--input_dir',
+        type=str,
+        default=os.path.join(os.getcwd(), input_dir),
+        help=f"Input directory containing {phase_name.lower()} processed files"
+    )
+    parser.add_argument(
+        '--output_dir',
+        type=str,
+        default=os.path.join(os.getcwd(), output_dir),
+        help="Output directory for final results"
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        client = build_client(llm_config, args)
+    except Exception as e:
+        logging.critical(f"LLM initialization failed: {str(e)}")
+        return
+
+    if not os.path.exists(args.input_dir):
+        logging.critical(f"Input directory not found: {args.input_dir}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    try:
+        template = create_template()
+        logging.info(f"{phase_name} prompt template loaded successfully")
+    except Exception as e:
+        logging.critical(f"Template loading failed: {str(e)}")
+        return
+
+    processed_files = 0
+    for root, _, files in os.walk(args.input_dir):
+        for file in files:
+            if not file.endswith('.txt'):
+                continue
+
+            file_path = os.path.join(root, file)
+            logging.info(f"Processing {file_path}")
+
+            try:
+                process_file(file_path, args.output_dir, template, step, client, args.max_concurrency,
+                             args.resume, args.chunk_tokens, args.batch_size)
+                processed_files += 1
+            except Exception as e:
+                logging.error(f"Failed processing {file}: {str(e)}")
+
+    logging.info(f"{phase_name} process completed. {processed_files} files handled.")
+    log_client_stats(client)
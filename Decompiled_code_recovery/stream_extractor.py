@@ -0,0 +1,148 @@
+import re
+from batch_prompts import END_MARKER
+
+
+FIXED_CODE_MARKER = "Fixed decompiled code:"
+FENCE_OPEN = re.compile(r'^[ \t]*```[\w+]*[ \t]*\n', re.MULTILINE)
+FENCE_CLOSE = re.compile(r'^[ \t]*```[ \t]*$', re.MULTILINE)
+PROSE_LINE = re.compile(r'^(#+\s|\*\*|[A-Z][A-Za-z ]*:\s*$|[A-Z][a-z]+(\s+[a-z]+){2,})')
+
+
+class CodeBlockExtractor:
+    """Incrementally locates the recovered code in a streamed completion.
+
+    feed() returns the code as soon as it is complete: when a fenced block
+    closes, or when a brace-balanced function after "Fixed decompiled code:"
+    (or at the very start of the reply) is followed by a line of prose.
+    Until then it returns None.
+
+    For a batched prompt of batch functions, the whole reply up to the
+    "### FUNCTION {batch} END" line is the code, so that every function
+    reaches parse_batch_response.
+    """
+
+    def __init__(self, batch: int = 1):
+        self.text = ''
+        self._batch_end = None
+        if batch > 1:
+            self._batch_end = re.compile(rf'^{re.escape(END_MARKER.format(idx=batch))}[ \t]*$', re.MULTILINE)
+        self.code = None
+        self._scan_pos = 0
+        self._code_start = None
+        self._depth = 0
+        self._in_comment = False
+        self._in_literal = None
+        self._header = ''
+        self._function_end = None
+
+    def feed(self, chunk: str):
+
+        if self.code is not None:
+            return self.code
+        self.text += chunk
+
+        if self._batch_end is not None:
+            end = self._batch_end.search(self.text)
+            if end:
+                self.code = self.text[:end.end()].strip()
+            return self.code
+
+        fence = FENCE_OPEN.search(self.text)
+        if fence and (self._code_start is None or self._depth == 0 and self._function_end is None):
+            close = FENCE_CLOSE.search(self.text, fence.end())
+            if close:
+                self.code = self.text[fence.end():close.start()].strip()
+            return self.code
+
+        if self._code_start is None:
+            marker = self.text.find(FIXED_CODE_MARKER)
+            if marker >= 0:
+                self._code_start = self._scan_pos = marker + len(FIXED_CODE_MARKER)
+            elif '{' in self.text and '```' not in self.text:
+                self._code_start = self._scan_pos = 0
+            else:
+                return None
+
+        self._scan_braces()
+        if self._function_end is not None:
+            self._check_trailing_prose()
+        return self.code
+
+    def _scan_braces(self):
+
+        text = self.text
+        i = self._scan_pos
+        # Leave a possibly incomplete comment opener or closer for the next feed
+        while i < len(text) - 1:
+            ch = text[i]
+            if self._in_comment:
+                if text.startswith('*/', i):
+                    self._in_comment = False
+                    i += 1
+            elif self._in_literal:
+                if ch == '\\':
+                    i += 1
+                elif ch == self._in_literal:
+                    self._in_literal = None
+            elif text.startswith('/*', i):
+                self._in_comment = True
+                i += 1
+            elif text.startswith('//', i):
+                newline = text.find('\n', i)
+                if newline < 0:
+                    break
+                i = newline
+                continue
+            elif ch in '"\'':
+                self._in_literal = ch
+            elif ch == '{':
+                if self._depth == 0:
+                    self._header = text[self._line_start(i):i]
+                    self._function_end = None
+                self._depth += 1
+            elif ch == '}':
+                self._depth = max(0, self._depth - 1)
+                if self._depth == 0 and ')' in self._header and not self._header.rstrip().endswith('='):
+                    self._function_end = i + 1
+            i += 1
+        self._scan_pos = i
+
+    def _line_start(self, pos: int) -> int:
+
+        # Function headers may span a few lines; keep everything since the last statement end
+        start = max(self.text.rfind(';', self._code_start, pos), self.text.rfind('}', self._code_start, pos))
+        return max(start + 1, self._code_start)
+
+    def _check_trailing_prose(self):
+
+        rest = self.text[self._function_end:]
+        for line in rest.split('\n')[:-1]:
+            stripped = line.strip()
+            if not stripped or stripped == ';':
+                continue
+            if PROSE_LINE.match(stripped):
+                self.code = self.text[self._code_start:self._function_end].strip()
+            return
+
+    def finish(self) -> str:
+        """The code if it was located, otherwise the whole reply."""
+        return self.code if self.code is not None else self.text.strip()
+
+
+def stream_until_code(llm, messages, batch: int = 1) -> tuple:
+    """Stream a completion and stop it as soon as the recovered code is complete.
+
+    batch is the number of functions in a batched prompt.
+    Returns (content, usage_metadata, stopped_early).
+    """
+    extractor = CodeBlockExtractor(batch)
+    usage = None
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            if extractor.feed(chunk.content or '') is not None:
+                return extractor.code, usage, True
+    finally:
+        stream.close()
+    return extractor.finish(), usage, False
@@ -0,0 +1,186 @@
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from array import array
+
+
+TIMING_FIELDS = ('queue_wait', 'throttle_wait', 'latency')
+COUNTER_FIELDS = ('requests', 'prompt_tokens', 'completion_tokens', 'retries', 'cache_hits', 'errors')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def input_label(file_name: str) -> str:
+    """Obfuscation input name (o1, cffobf, ...) of a phase input or output file."""
+    base = file_name.rsplit('.', 1)[0]
+    return re.sub(r'(_step\d+)+$', '', base)
+
+
+def add_metric(metrics: dict, key: str, value):
+
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + value
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class MetricsAggregate:
+    """Running per-phase and per-(phase, input) totals of query records.
+
+    Counters are summed as records arrive; only the timing values needed
+    for exact percentiles are kept, as packed floats, so memory stays far
+    below that of the records themselves.
+    """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, record: dict):
+
+        for key in ((record['phase'], '*'), (record['phase'], record['input'])):
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = {'queries': 0,
+                                            'timings': {field: array('d') for field in TIMING_FIELDS},
+                                            'counters': dict.fromkeys(COUNTER_FIELDS, 0)}
+            group['queries'] += 1
+            for field in TIMING_FIELDS:
+                group['timings'][field].append(record.get(field, 0.0))
+            for field in COUNTER_FIELDS:
+                group['counters'][field] += record.get(field, 0)
+
+    def summary(self) -> dict:
+        """Per-phase and per-(phase, input) latency percentiles and counter totals."""
+        summary = {}
+        for key, group in self.groups.items():
+            stats = {'queries': group['queries']}
+            for field, values in group['timings'].items():
+                for q in QUANTILES:
+                    stats[f"{field}_p{int(q * 100)}"] = percentile(values, q)
+                stats[f"{field}_sum"] = sum(values)
+            stats.update(group['counters'])
+            summary[key] = stats
+        return summary
+
+
+def summarize(records) -> dict:
+    """Per-phase and per-(phase, input) latency percentiles and counter totals."""
+    aggregate = MetricsAggregate()
+    for record in records:
+        aggregate.add(record)
+    return aggregate.summary()
+
+
+def format_report(summary: dict) -> str:
+
+    header = (f"{'phase':<8} {'input':<10} {'queries':>7} {'lat p50':>8} {'lat p95':>8} {'lat p99':>8} "
+              f"{'wait p95':>8} {'prompt tok':>10} {'compl tok':>10} {'retries':>7} {'cache hit':>9}")
+    lines = [header, '-' * len(header)]
+    for (phase, input_name), stats in sorted(summary.items()):
+        hit_rate = stats['cache_hits'] / stats['requests'] if stats['requests'] else 0.0
+        lines.append(
+            f"{phase:<8} {'ALL' if input_name == '*' else input_name:<10} {stats['queries']:>7} "
+            f"{stats['latency_p50']:>7.2f}s {stats['latency_p95']:>7.2f}s {stats['latency_p99']:>7.2f}s "
+            f"{stats['queue_wait_p95']:>7.2f}s {stats['prompt_tokens']:>10.0f} {stats['completion_tokens']:>10.0f} "
+            f"{stats['retries']:>7.0f} {hit_rate:>9.0%}"
+        )
+    return "\n".join(lines)
+
+
+def format_prometheus(summary: dict) -> str:
+
+    lines = []
+    for field in TIMING_FIELDS:
+        name = f"recovery_query_{field}_seconds"
+        lines += [f"# HELP {name} Per-query {field.replace('_', ' ')} in seconds", f"# TYPE {name} summary"]
+        for (phase, input_name), stats in sorted(summary.items()):
+            if input_name == '*':
+                continue
+            labels = f'phase="{phase}",input="{input_name}"'
+            for q in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {stats[f"{field}_p{int(q * 100)}"]:.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {stats[f'{field}_sum']:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {stats['queries']}")
+    for field in COUNTER_FIELDS:
+        name = f"recovery_{field}_total"
+        lines += [f"# HELP {name} Total {field.replace('_', ' ')}", f"# TYPE {name} counter"]
+        for (phase, input_name), stats in sorted(summary.items()):
+            if input_name != '*':
+                lines.append(f'{name}{{phase="{phase}",input="{input_name}"}} {stats[field]:g}')
+    return "\n".join(lines) + "\n"
+
+
+def iter_records(paths: list):
+    """Records of JSONL metrics files, read one line at a time."""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class MetricsSink:
+    """Appends one JSON record per query to a JSONL file and aggregates them for the end-of-run summary."""
+
+    def __init__(self, jsonl_path: str = None, prometheus_path: str = None):
+        self.prometheus_path = prometheus_path
+        self.aggregate = MetricsAggregate()
+        self._lock = threading.Lock()
+        self._file = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def emit(self, phase: str, input_name: str, query: int, metrics: dict, **extra):
+
+        record = {'ts': time.time(), 'phase': phase, 'input': input_name, 'query': query}
+        record.update({field: round(metrics.get(field, 0.0), 4) for field in TIMING_FIELDS})
+        record.update({field: metrics.get(field, 0) for field in COUNTER_FIELDS})
+        record.update(extra)
+        with self._lock:
+            self.aggregate.add(record)
+            if self._file is not None:
+                self._file.write(json.dumps(record) + "\n")
+                self._file.flush()
+
+    def summary(self) -> dict:
+
+        with self._lock:
+            return self.aggregate.summary()
+
+    def close(self):
+
+        summary = self.summary()
+        if self.prometheus_path:
+            with open(self.prometheus_path, 'w', encoding='utf-8') as f:
+                f.write(format_prometheus(summary))
+        if self._file is not None:
+            self._file.close()
+        return summary
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Summarize per-query recovery metrics (p50/p95/p99 per phase and per input)",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('metrics', nargs='+', help="JSONL metrics files written with --metrics_path")
+    parser.add_argument('--prometheus_path', type=str, default=None,
+                        help="Also write the summary in Prometheus text exposition format")
+    args = parser.parse_args()
+
+    summary = summarize(iter_records(args.metrics))
+    print(format_report(summary))
+    if args.prometheus_path:
+        with open(args.prometheus_path, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import pytest
+from batch_prompts import BatchParseError, build_batch_code, parse_batch_response
+
+
+def block(idx: int, code: str) -> str:
+
+    return f"### FUNCTION {idx} BEGIN\n{code}\n### FUNCTION {idx} END\n"
+
+
+def test_reordered_markers_are_returned_in_function_order():
+
+    reply = block(2, "int g(void) { return 2; }") + "\n" + block(1, "int f(void) { return 1; }")
+    assert parse_batch_response(reply, 2) == ["int f(void) { return 1; }", "int g(void) { return 2; }"]
+
+
+def test_markers_and_fences_are_stripped():
+
+    functions = ["int f(void) { return 1; }", "int g(void) { return 2; }"]
+    assert parse_batch_response(build_batch_code(functions), 2) == functions
+    reply = "Here you go:\n" + block(1, "```c\n" + functions[0] + "\n```") + block(2, functions[1])
+    assert parse_batch_response(reply, 2) == functions
+
+
+@pytest.mark.parametrize('reply', [
+    block(1, "int f(void) { return 1; }"),
+    block(1, "int f(void) { return 1; }") + block(2, ""),
+    "### FUNCTION 1 BEGIN\nint f(void) { return 1; }\n### FUNCTION 2 END\n" + block(2, "int g(void) { return 2; }"),
+    block(1, "int f(void) { return 1; }") + block(1, "int f(void) { return 1; }") + block(2, "int g(void);"),
+    block(1, "int f(void);") + block(2, "int g(void);") + block(3, "int h(void);"),
+])
+def test_missing_duplicated_or_extra_functions_are_rejected(reply):
+
+    with pytest.raises(BatchParseError):
+        parse_batch_response(reply, 2)
@@ -0,0 +1,40 @@
+from checkpoint_journal import QueryJournal
+
+
+def test_resume_drops_a_truncated_last_entry(tmp_path):
+
+    path = str(tmp_path / 'o1_step1.journal.jsonl')
+    journal = QueryJournal(path)
+    journal.record(1, 'int f();', 'int f(void);')
+    journal.record(2, 'int g();', 'int g(void);')
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"idx": 3, "query_sha": "12ab')
+
+    resumed = QueryJournal(path, resume=True)
+    assert resumed.is_done(1, 'int f();')
+    assert resumed.is_done(2, 'int g();')
+    assert not resumed.is_done(3, 'int h();')
+    assert not resumed.is_done(1, 'int f(int a);')
+    assert resumed.content(2) == 'int g(void);'
+
+    resumed.record(3, 'int h();', 'int h(void);')
+    output_path = tmp_path / 'o1_step1.txt'
+    resumed.assemble(str(output_path), 4, {4: 'step1 failed: timeout'})
+    resumed.close()
+    assert output_path.read_text(encoding='utf-8') == (
+        "Query 1:\nint f(void);\n\n/////\nQuery 2:\nint g(void);\n\n/////\n"
+        "Query 3:\nint h(void);\n\n/////\nQuery 4:\n[ERROR] step1 failed: timeout\n"
+    )
+
+
+def test_without_resume_the_journal_starts_empty(tmp_path):
+
+    path = str(tmp_path / 'o1_step1.journal.jsonl')
+    journal = QueryJournal(path)
+    journal.record(1, 'int f();', 'int f(void);')
+    journal.close()
+
+    restarted = QueryJournal(path)
+    assert not restarted.is_done(1, 'int f();')
+    restarted.close()
@@ -0,0 +1,49 @@
+import re
+from prompt_chunker import CFS_PREFIX, TokenCounter, chunk_code
+
+
+FUNCTION = "int sum(int *a, int n)\n{\n    int total = 0;\n" + "".join(
+    f"    if (a[{i}] > {i}) {{\n        total += a[{i}] * {i};\n    }}\n" for i in range(60)
+) + "    return total;\n}\n"
+
+
+def without_whitespace(text: str) -> str:
+
+    return re.sub(r'\s+', '', text)
+
+
+def test_code_that_fits_is_returned_unchanged():
+
+    assert chunk_code(FUNCTION, 100000, TokenCounter()) == [FUNCTION]
+
+
+def test_chunks_fit_the_budget_and_keep_every_statement():
+
+    counter = TokenCounter()
+    chunks = chunk_code(FUNCTION, 120, counter)
+    assert len(chunks) > 1
+    assert all(counter.count(chunk) <= 120 for chunk in chunks)
+    assert without_whitespace(''.join(chunks)) == without_whitespace(FUNCTION)
+    # Every chunk ends on a statement boundary
+    assert all(chunk.rstrip().endswith((';', '{', '}')) for chunk in chunks)
+
+
+def test_a_line_without_boundaries_is_split_on_tokens():
+
+    counter = TokenCounter()
+    line = "x = f(" + ", ".join(f"a{i}" for i in range(2500)) + ")"
+    chunks = chunk_code(line, 100, counter)
+    assert len(chunks) > 1
+    assert all(counter.count(chunk) <= 100 for chunk in chunks)
+    assert without_whitespace(''.join(chunks)) == without_whitespace(line)
+
+
+def test_the_control_flow_line_is_repeated_in_every_chunk():
+
+    counter = TokenCounter()
+    header = f"{CFS_PREFIX} {{if (>){{}}if (>){{}}}}"
+    chunks = chunk_code(f"{header}\n{FUNCTION}", 150, counter)
+    assert len(chunks) > 1
+    assert all(chunk.startswith(header + "\n") for chunk in chunks)
+    assert all(counter.count(chunk) <= 150 for chunk in chunks)
+    assert without_whitespace(''.join(chunk[len(header):] for chunk in chunks)) == without_whitespace(FUNCTION)
@@ -0,0 +1,80 @@
+import pytest
+import rate_limiter
+from rate_limiter import AdaptiveRateLimiter, call_with_retry, is_rate_limit, is_retryable
+
+
+class APIStatusError(Exception):
+
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+RateLimitError = type('RateLimitError', (Exception,), {})
+APITimeoutError = type('APITimeoutError', (Exception,), {})
+
+
+@pytest.mark.parametrize('error', [
+    TimeoutError(), ConnectionError(), APIStatusError(429), APIStatusError(503), RateLimitError(), APITimeoutError()
+])
+def test_retryable_errors(error):
+
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize('error', [APIStatusError(400), APIStatusError(401), ValueError(), KeyError('model')])
+def test_non_retryable_errors(error):
+
+    assert not is_retryable(error)
+
+
+def test_rate_limit_errors():
+
+    assert is_rate_limit(APIStatusError(429))
+    assert is_rate_limit(RateLimitError())
+    assert not is_rate_limit(APIStatusError(503))
+
+
+def test_retryable_failures_are_retried_and_throttle_the_limiter(monkeypatch):
+
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    errors = [APIStatusError(429), APIStatusError(502)]
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+
+    limiter = AdaptiveRateLimiter(rpm=60)
+    assert call_with_retry(call, max_retries=3, limiter=limiter) == ('ok', 2)
+    assert limiter.rate_limited == 1
+    assert limiter.request_bucket.rate_per_minute == 30
+    assert limiter.request_bucket.capacity == 30
+
+
+def test_non_retryable_failures_are_raised_at_once(monkeypatch):
+
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise APIStatusError(401)
+
+    with pytest.raises(APIStatusError):
+        call_with_retry(call, max_retries=3)
+    assert len(calls) == 1
+
+
+def test_retries_stop_after_max_retries(monkeypatch):
+
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        call_with_retry(call, max_retries=2)
+    assert len(calls) == 3
@@ -0,0 +1,32 @@
+import itertools
+import response_cache
+from response_cache import ResponseCache
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, monkeypatch):
+
+    clock = itertools.count(1)
+    monkeypatch.setattr(response_cache.time, 'time', lambda: float(next(clock)))
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), {'model': 'm', 'temperature': 0.5}, max_bytes=25)
+    cache.put('prompt a', 'a' * 10)
+    cache.put('prompt b', 'b' * 10)
+    assert cache.get('prompt a') == 'a' * 10
+    cache.put('prompt c', 'c' * 10)
+
+    assert cache.get('prompt b') is None
+    assert cache.get('prompt a') == 'a' * 10
+    assert cache.get('prompt c') == 'c' * 10
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'entries': 2, 'bytes': 20}
+    cache.close()
+
+
+def test_keys_depend_on_the_model_parameters(tmp_path):
+
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path, {'model': 'm', 'temperature': 0.5})
+    cache.put('prompt', 'response')
+    cache.close()
+
+    streamed = ResponseCache(path, {'model': 'm', 'temperature': 0.5, 'stream': True})
+    assert streamed.get('prompt') is None
+    streamed.close()
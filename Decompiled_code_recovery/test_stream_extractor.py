@@ -0,0 +1,55 @@
+from batch_prompts import parse_batch_response
+from stream_extractor import CodeBlockExtractor
+
+
+BATCH_REPLY = """### FUNCTION 1 BEGIN
+int f(int a) {
+    return a + 1;
+}
+### FUNCTION 1 END
+### FUNCTION 2 BEGIN
+```c
+int g(int b) {
+    if (b) {
+        return 2;
+    }
+    return 0;
+}
+```
+### FUNCTION 2 END
+Both functions were simplified.
+"""
+
+
+def feed_in_chunks(extractor, text, size=7):
+
+    for start in range(0, len(text), size):
+        if extractor.feed(text[start:start + size]) is not None:
+            return extractor.code, start + size
+    return extractor.finish(), len(text)
+
+
+def test_single_function_stops_after_trailing_prose():
+
+    reply = "Fixed decompiled code:\nint f(int a) {\n    return a;\n}\nThe function returns its argument.\nMore text\n"
+    code, consumed = feed_in_chunks(CodeBlockExtractor(), reply)
+    assert code == "int f(int a) {\n    return a;\n}"
+    assert consumed < len(reply)
+
+
+def test_batch_reply_keeps_every_function():
+
+    code, consumed = feed_in_chunks(CodeBlockExtractor(batch=2), BATCH_REPLY)
+    assert code.endswith("### FUNCTION 2 END")
+    assert consumed < len(BATCH_REPLY)
+    assert parse_batch_response(code, 2) == [
+        "int f(int a) {\n    return a + 1;\n}",
+        "int g(int b) {\n    if (b) {\n        return 2;\n    }\n    return 0;\n}",
+    ]
+
+
+def test_batch_reply_is_not_cut_at_the_first_function():
+
+    extractor = CodeBlockExtractor(batch=2)
+    first = BATCH_REPLY[:BATCH_REPLY.index("### FUNCTION 2 BEGIN")]
+    assert extractor.feed(first + "Some prose after the first function.\n") is None
@@ -1,130 +1,80 @@
 import os
-import csv
-import torch
-from transformers import AutoTokenizer, AutoModel
-import numpy as np
+import argparse
 import glob
-import re
-from collections import defaultdict, Counter
-import uuid
-
-# Initialize device
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"Using device: {device}")
-
-# Load fine-tuned CodeBERT model and tokenizer
-FINETUNED_MODEL_PATH = "microsoft/graphcodebert-base"
-tokenizer = AutoTokenizer.from_pretrained(FINETUNED_MODEL_PATH)
-model = AutoModel.from_pretrained(FINETUNED_MODEL_PATH)
-model.to(device)
-
-class SimpleCodeFolder:
-    """Simple code folder with no_folding method only"""
-
-    def __init__(self, tokenizer, max_tokens=512):
-        self.tokenizer = tokenizer
-        self.max_tokens = max_tokens
-
-    def fold_code(self, code):
-        """Main code folding interface - uses no_folding method"""
-        try:
-            return self._no_folding(code)
-        except Exception as e:
-            print(f"  Error in fold_code: {e}, falling back to truncation")
-            tokens = self.tokenizer.tokenize(code)[:self.max_tokens]
-            return self.tokenizer.convert_tokens_to_string(tokens)
-
-    def _no_folding(self, code):
-        """No folding, directly return original code or truncate if too long"""
-        tokens = self.tokenizer.tokenize(code)
-        if len(tokens) > self.max_tokens:
-            print(f"  No_folding exceeds max_tokens ({len(tokens)} > {self.max_tokens}), truncating...")
-            return self.tokenizer.convert_tokens_to_string(tokens[:self.max_tokens])
-        return code
-
-# Initialize folder
-code_folder = SimpleCodeFolder(tokenizer, max_tokens=512)
-
-def fold_code(code, tokenizer=None, max_tokens=512):
-    """Fold code function"""
-    return code_folder.fold_code(code)
-
-def generate_code_embedding(folded_code):
-    """Generate code embedding, ensure 1D output"""
-    if not folded_code or not folded_code.strip():
-        print("  Warning: Empty folded code, returning zero embedding")
-        return np.zeros(768)
-    try:
-        inputs = tokenizer(folded_code, return_tensors="pt", truncation=True, padding=True, max_length=512)
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-        with torch.no_grad():
-            outputs = model(**inputs)
-        # Flatten to 1D vector
-        embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy().ravel()
-        if embedding.shape != (768,):
-            print(f"  Warning: Embedding shape {embedding.shape}, reshaping to (768,)")
-            embedding = embedding.reshape(768)
-        return embedding
-    except Exception as e:
-        print(f"  Error generating embedding: {e}, returning zero embedding")
-        return np.zeros(768)
+from code_embedder import add_embedder_arguments, embedder_from_args
+from embedding_store import EmbeddingStore
+from embedding_worker import EmbeddingClient
+from embedding_pipeline import EmbeddingPipeline
+from csv_loader import LoadReport, iter_functions
+from fingerprint import FingerprintIndex
 
 def preprocess_csv(file_path):
-    """Preprocess CSV file"""
-    for encoding in ['utf-8', 'latin-1', 'cp1252']:
-        try:
-            with open(file_path, 'r', encoding=encoding) as csvfile:
-                reader = csv.reader(csvfile)
-                next(reader, None)  # Skip header
-                rows = [{"id": row[0].strip(), "function_name": row[1].strip(), "code": row[2].replace('\\n', '\n').replace('\\t', '\t')}
-                        for row in reader if len(row) == 3]
-                print(f"Preprocessed {len(rows)} functions from {file_path} using {encoding} encoding.")
-                return rows
-        except UnicodeDecodeError:
-            continue
-    print(f"Error: Could not decode {file_path}.")
-    return []
-
-def process_function(row):
-    """Process single function"""
-    function_name, code = row['function_name'], row['code']
-    print(f"Processing function: {function_name}")
-
-    original_tokens = len(tokenizer.tokenize(code))
-    if original_tokens > 512:
-        print(f"  Original code: {original_tokens} tokens > 512, applying folding...")
-
-    try:
-        folded_code = fold_code(code)
-        embedding = generate_code_embedding(folded_code)
-        folded_tokens = len(tokenizer.tokenize(folded_code))
-        print(f"  Folded to: {folded_tokens} tokens")
-        if original_tokens > 512:
-            print(f"  Token reduction: {(original_tokens - folded_tokens) / original_tokens * 100:.1f}%")
-    except Exception as e:
-        print(f"  Error processing {function_name}: {e}, returning zero embedding")
-        folded_tokens = 0
-        embedding = np.zeros(768)
-
-    return function_name, embedding
+    """Stream the functions of a CSV file, then report how many rows were loaded or rejected"""
+    report = LoadReport(file_path)
+    yield from iter_functions(file_path, report)
+    print(report.format())
 
 def get_csv_files(folder):
     """Get all CSV files from folder"""
     return glob.glob(os.path.join(folder, '*.csv'))
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate GraphCodeBERT embeddings for decompiled functions",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--csv_folder', default='1_original_csv_fine_grain', help="Folder of input CSV files")
+    parser.add_argument('--output_folder', default='3_embedding_npy_fine_grain', help="Folder for the .npy embeddings")
+    add_embedder_arguments(parser)
+    parser.add_argument('--worker', default=None,
+                        help="HOST:PORT of a running embedding_worker.py; its model options replace the ones above")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32',
+                        help="Precision of the saved embedding matrix")
+    parser.add_argument('--store_path', default='embedding_store.sqlite',
+                        help="Embedding store reused across runs, keyed by code hash and model")
+    parser.add_argument('--no_store', action='store_true', help="Embed every function without using the store")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Processes that tokenize and fold upcoming chunks during inference (0 tokenizes inline)")
+    parser.add_argument('--chunk_size', type=int, default=1024, help="Functions read, embedded and written at a time")
+    parser.add_argument('--prefetch', type=int, default=2, help="Prepared chunks allowed to wait for the model")
+    parser.add_argument('--prefilter_csv', default=None,
+                        help="Library functions as CSV; test functions whose fingerprint matches one are not embedded")
+    parser.add_argument('--prefilter_threshold', type=float, default=0.9,
+                        help="Estimated Jaccard similarity for MinHash prefilter hits (above 1 keeps only exact ones)")
+    parser.add_argument('--prune_store', action='store_true',
+                        help="Delete stored embeddings of functions that are no longer in any CSV")
+    args = parser.parse_args()
+
     print(f"=== Code Embedding Script ===")
-    csv_folder = '1_original_csv_fine_grain'
-    output_folder = '3_embedding_npy_fine_grain'
-    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(args.output_folder, exist_ok=True)
+    embedder = EmbeddingClient(args.worker) if args.worker else embedder_from_args(args)
+    if args.worker:
+        print(f"Using embedding worker at {args.worker} ({embedder.model_key})")
+    store = None if args.no_store else EmbeddingStore(args.store_path, embedder.model_key)
+    prefilter = None
+    if args.prefilter_csv:
+        prefilter = FingerprintIndex.build(((row['function_name'], row['code']) for row in preprocess_csv(args.prefilter_csv)),
+                                           threshold=args.prefilter_threshold)
+        print(f"Fingerprinted {len(prefilter.names)} library functions for the prefilter")
+    pipeline = EmbeddingPipeline(embedder, store, args.dtype, args.workers, args.chunk_size, args.prefetch, prefilter)
+
+    def sources():
+        for csv_file in get_csv_files(args.csv_folder):
+            print(f"\nProcessing CSV file: {csv_file}")
+            npy_path = os.path.join(args.output_folder, os.path.basename(csv_file).replace('.csv', '_embeddings.npy'))
+            yield preprocess_csv(csv_file), npy_path
 
-    for csv_file in get_csv_files(csv_folder):
-        print(f"\nProcessing CSV file: {csv_file}")
-        rows = preprocess_csv(csv_file)
-        embeddings = {name: emb for name, emb in (process_function(row) for row in rows)}
-        npy_path = os.path.join(output_folder, os.path.basename(csv_file).replace('.csv', '_embeddings.npy'))
-        np.save(npy_path, embeddings)
-        print(f"Embeddings saved to {npy_path}")
+    try:
+        pipeline.run(sources())
+    finally:
+        pipeline.close()
+
+    if store:
+        if args.prune_store:
+            print(f"Pruned {store.prune(pipeline.seen_keys)} stale embeddings from {args.store_path}")
+        stats = store.stats()
+        print(f"Embedding store: {stats['hits']} reused, {stats['misses']} embedded, {stats['entries']} entries")
+        store.close()
+    if args.worker:
+        embedder.close()
 
     print("\nAll CSV files processed.")
 
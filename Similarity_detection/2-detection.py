@@ -1,42 +1,60 @@
 import os
+import argparse
+import csv
+import importlib.util
+import time
 import numpy as np
-from scipy.spatial.distance import cosine
-import pandas as pd
 import re
+from embedding_io import load_embedding_matrix
+from vector_search import NormalizedRows, normalize_rows, top_k_search
+from ann_index import ANN_BACKENDS, load_or_build_index, recall_check
+from quantization import QUANT_MODES, load_or_build_quantized
+from fingerprint import load_prefilter_hits
+from reranker import RERANK_METRICS, Reranker, load_codes, test_csv_path
 
 def calculate_similarity(vector_a, vector_b):
 
-    vector_a = vector_a.squeeze()
-    vector_b = vector_b.squeeze()
+    from scipy.spatial.distance import cosine
+    vector_a = np.asarray(vector_a, dtype=np.float32).squeeze()
+    vector_b = np.asarray(vector_b, dtype=np.float32).squeeze()
     return 1 - cosine(vector_a, vector_b)
 
-def load_embeddings(npy_path):
+def load_embeddings(npy_path, allow_pickle=False):
 
-    data = np.load(npy_path, allow_pickle=True).item()
-    for key in data:
-        data[key] = data[key].squeeze()
-    return data
+    names, matrix = load_embedding_matrix(npy_path, allow_pickle=allow_pickle)
+    return dict(zip(names, matrix))
 
 def get_top_k_matches(test_vector, library_vectors, library_names, k=5):
 
-    similarities = [(name, calculate_similarity(test_vector, vector))
-                    for name, vector in zip(library_names, library_vectors)]
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    return similarities[:k]
+    return get_top_k_matches_batch(normalize_rows(np.asarray(test_vector)), normalize_rows(np.asarray(library_vectors)),
+                                   library_names, k)[0]
+
+def get_top_k_matches_batch(test_normed, library_normed, library_names, k=5, searcher=None):
+    """Top-k (name, similarity) lists for all L2-normalized test vectors with one chunked matrix multiply,
+    or with the approximate index or quantized library when one is given"""
+    if searcher is not None:
+        indices, scores = searcher.search(test_normed, k)
+    else:
+        indices, scores = top_k_search(test_normed, library_normed, k)
+    return [[(library_names[i], float(score)) for i, score in zip(row_indices, row_scores) if i >= 0]
+            for row_indices, row_scores in zip(indices, scores)]
 
 def evaluate_detection_rate(top_k_results, true_name):
 
     return [1 if true_name in [name for name, _ in top_k_results[:k]] else 0 for k in [1, 3, 5]]
 
-def verify_embedding_dimensions(function_library, test_function):
+def detection_counts(top_k_lists, test_names):
+
+    detections = [evaluate_detection_rate(top_k_results, name) for top_k_results, name in zip(top_k_lists, test_names)]
+    return [sum(column) for column in zip(*detections)] if detections else [0, 0, 0]
 
-    library_dims = set(tuple(vector.shape) for vector in function_library.values())
-    test_dims = set(tuple(vector.shape) for vector in test_function.values())
-    if len(library_dims) != 1 or len(test_dims) != 1:
+def verify_embedding_dimensions(library_vectors, test_vectors):
+
+    if library_vectors.shape[1:] != test_vectors.shape[1:]:
         print("Warning: Inconsistent embedding dimensions detected.")
     else:
-        print(f"All library embeddings have shape: {library_dims.pop()}")
-        print(f"All test embeddings have shape: {test_dims.pop()}")
+        print(f"All library embeddings have shape: {library_vectors.shape[1:]}")
+        print(f"All test embeddings have shape: {test_vectors.shape[1:]}")
 
 def write_results_to_txt(results, output_file):
 
@@ -59,17 +77,141 @@ def parse_filename(filename):
         print(f"Warning: Filename {filename} does not match expected format")
         return None, None
 
+def load_test_file(test_folder, test_file, allow_pickle=False, unreadable=None):
+    """Names and vectors of one test file with the obfuscation and method parsed from its name, or None to skip it
+
+    Files that cannot be read are appended to unreadable.
+    """
+    obfuscation, method = parse_filename(test_file)
+    if not obfuscation or not method:
+        return None
+    test_path = os.path.join(test_folder, test_file)
+    try:
+        test_names, test_vectors = load_embedding_matrix(test_path, allow_pickle=allow_pickle)
+    except ValueError as e:
+        # Typically a legacy pickled file; the message says how to convert it
+        print(f"Skipping {test_file}: {e}")
+        if unreadable is not None:
+            unreadable.append(test_file)
+        return None
+    test_function = dict(zip(test_names, test_vectors))
+    # Functions the fingerprint prefilter resolved were never embedded
+    prefiltered = load_prefilter_hits(test_path)
+    if not test_function and not prefiltered:
+        print(f"Skipping {test_file}: no embeddings")
+        return None
+    vectors = np.stack(list(test_function.values())) if test_function else np.zeros((0, test_vectors.shape[-1]))
+    return {'file': test_file, 'obfuscation': obfuscation, 'method': method, 'names': list(test_function),
+            'vectors': vectors, 'prefiltered': prefiltered}
+
+def detection_table(results, obfuscations):
+    """Rows of method, metric, the rate of every obfuscation and their average over the files that were tested"""
+    rows = []
+    for method in results:
+        for metric in ['top-1', 'top-3', 'top-5']:
+            rates = [results[method][obf][metric] for obf in obfuscations]
+            # 计算平均值
+            valid_rates = [results[method][obf][metric] for obf in obfuscations if results[method][obf]['count'] > 0]
+            rows.append([method, metric] + rates + [sum(valid_rates) / len(valid_rates) if valid_rates else 0])
+    return rows
+
+def write_excel(rows, columns, excel_path):
+
+    import pandas as pd
+    data = [row[:2] + [f"{rate:.0%}" if rate > 0 else "0%" for rate in row[2:-1]] + [f"{row[-1]:.0%}"] for row in rows]
+    df = pd.DataFrame(data, columns=columns)
+    df.set_index(['method', 'Mterics'], inplace=True)
+    with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Results')
+
+def write_table(rows, columns, path, table_format='csv'):
+    """Write the detection table with rates as fractions, as CSV with the csv module or as Parquet through pandas"""
+    if table_format == 'parquet':
+        import pandas as pd
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(row[:2] + [f"{rate:.4f}" for rate in row[2:]] for row in rows)
+
 def main():
 
-    library_path = 'function_library_embeddings.npy'
-    test_folder = '3_embedding_npy_fine_grain'
-    result_folder = '4_detection_result'
+    parser = argparse.ArgumentParser(description="Detect the library functions most similar to each test function",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--library_path', default='function_library_embeddings.npy', help="Library embeddings")
+    parser.add_argument('--test_folder', default='3_embedding_npy_fine_grain', help="Folder of test embeddings")
+    parser.add_argument('--result_folder', default='4_detection_result', help="Output folder")
+    parser.add_argument('--allow_pickle', action='store_true',
+                        help="Also read legacy pickled embedding files (unpickling can run arbitrary code)")
+    parser.add_argument('--ann', choices=ANN_BACKENDS, default=None,
+                        help="Search an approximate index (hnswlib HNSW or faiss IVF-PQ) instead of the exact matrix")
+    parser.add_argument('--ann_ef_search', type=int, default=64, help="HNSW candidate list size, higher is more accurate")
+    parser.add_argument('--ann_nprobe', type=int, default=16, help="IVF-PQ lists probed per query, higher is more accurate")
+    parser.add_argument('--ann_rebuild', action='store_true', help="Rebuild the persisted index even if it is current")
+    parser.add_argument('--ann_recall_sample', type=int, default=200,
+                        help="Queries per test file checked against exact search (0 disables the recall check)")
+    parser.add_argument('--quantize', choices=QUANT_MODES, default='fp32',
+                        help="Precision of the library and test vectors during exact search")
+    parser.add_argument('--pq_m', type=int, default=96, help="Sub-vectors per embedding for --quantize pq")
+    parser.add_argument('--quantize_compare', action='store_true',
+                        help="Also search at full precision and report the change in Top-1/3/5")
+    parser.add_argument('--batch', action='store_true',
+                        help="Load every test file first and score them all with one stacked search")
+    parser.add_argument('--no_excel', '--no-excel', action='store_true',
+                        help="Write the detection table as CSV or Parquet instead of results.xlsx")
+    parser.add_argument('--table_format', choices=['csv', 'parquet'], default='csv',
+                        help="Format of the detection table with --no_excel")
+    parser.add_argument('--rerank', action='store_true',
+                        help="Re-rank the vector top-K of each test function by structural similarity of the source code")
+    parser.add_argument('--rerank_k', type=int, default=50, help="Candidates from the vector search that are re-ranked")
+    parser.add_argument('--rerank_metrics', nargs='+', choices=RERANK_METRICS, default=list(RERANK_METRICS),
+                        help="Metrics of similarity.py used for re-ranking")
+    parser.add_argument('--rerank_weight', type=float, default=0.5,
+                        help="Weight of the structural score against the cosine similarity (1 ranks by structure only)")
+    parser.add_argument('--rerank_workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes computing structural similarity, 0 computes it in the main process")
+    parser.add_argument('--library_csv', default=None, help="Source code of the library functions, needed by --rerank")
+    parser.add_argument('--csv_folder', default='1_original_csv_fine_grain',
+                        help="Test CSV files the test embeddings were made from, read by --rerank")
+    args = parser.parse_args()
+    if args.rerank and not args.library_csv:
+        parser.error("--rerank needs --library_csv with the source code of the library functions")
+    if args.no_excel and args.table_format == 'parquet' and not any(
+            importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet')):
+        parser.error("--table_format parquet needs pyarrow or fastparquet installed")
+
+    library_path = args.library_path
+    test_folder = args.test_folder
+    result_folder = args.result_folder
     os.makedirs(result_folder, exist_ok=True)
 
 
-    function_library = load_embeddings(library_path)
-    library_names = list(function_library.keys())
-    library_vectors = list(function_library.values())
+    library_names, library_vectors = load_embedding_matrix(library_path, allow_pickle=args.allow_pickle)
+    searcher = None
+    # Quantized and ANN searchers read the (memory-mapped) library through a normalizing view;
+    # the full float32 copy is only made for exact search or for --quantize_compare
+    quantized = not args.ann and args.quantize != 'fp32'
+    if args.ann or quantized and not args.quantize_compare:
+        library_normed = NormalizedRows(library_vectors)
+    else:
+        library_normed = normalize_rows(library_vectors)
+    if args.ann:
+        search_param = args.ann_ef_search if args.ann == 'hnsw' else args.ann_nprobe
+        searcher = load_or_build_index(library_path, library_normed, args.ann, search_param, args.ann_rebuild)
+    elif args.quantize != 'fp32':
+        searcher = load_or_build_quantized(library_path, library_normed, args.quantize, args.pq_m)
+    compare_totals = {'count': 0, 'full': [0, 0, 0], 'quantized': [0, 0, 0]}
+    search_k = 5
+    reranker = None
+    if args.rerank:
+        search_k = max(5, args.rerank_k)
+        library_codes = load_codes(args.library_csv)
+        print(f"Re-ranking the top {search_k} of each test function with {', '.join(args.rerank_metrics)} "
+              f"({len(library_codes)} library functions with source code)")
+        reranker = Reranker(library_codes, args.rerank_metrics, args.rerank_weight, args.rerank_workers)
+    rerank_totals = {'count': 0, 'vector': [0, 0, 0], 'reranked': [0, 0, 0], 'search_s': 0.0, 'searched': 0,
+                     'rerank_s': 0.0, 'queries': 0}
 
 
     results = {}
@@ -81,34 +223,94 @@ def main():
         print("No npy test files found in folder:", test_folder)
         return
 
-    for test_file in test_files:
-        test_path = os.path.join(test_folder, test_file)
-        print(f"\nProcessing test file: {test_path}")
-        test_function = load_embeddings(test_path)
-        verify_embedding_dimensions(function_library, test_function)
-
-
-        obfuscation, method = parse_filename(test_file)
-        if not obfuscation or not method:
+    def search_checks(test_normed, top_k_lists, test_names, label):
+        if not test_names:
+            return
+        if args.ann and args.ann_recall_sample > 0:
+            check = recall_check(searcher, test_normed, k=5, sample=args.ann_recall_sample)
+            print(f"  {label}{args.ann} recall@5 vs exact on {check['queries']} queries: {check['recall']:.2%} "
+                  f"({check['ann_ms']:.3f} ms/query vs {check['exact_ms']:.3f} ms/query exact)")
+        if not args.ann and args.quantize != 'fp32' and args.quantize_compare:
+            full = detection_counts(get_top_k_matches_batch(test_normed, library_normed, library_names, k=5), test_names)
+            quantized = detection_counts(top_k_lists, test_names)
+            compare_totals['count'] += len(test_names)
+            for i in range(3):
+                compare_totals['full'][i] += full[i]
+                compare_totals['quantized'][i] += quantized[i]
+            print(f"  {label}{args.quantize} vs fp32: " + ", ".join(
+                f"Top-{k} {q / len(test_names):.2%} ({(q - f) / len(test_names):+.2%})"
+                for k, f, q in zip((1, 3, 5), full, quantized)))
+
+    unreadable = []
+    tests = (load_test_file(test_folder, test_file, args.allow_pickle, unreadable) for test_file in test_files)
+    tests = [test for test in tests if test is not None] if args.batch else tests
+    if args.batch and tests:
+        # 一次性计算所有待测函数的 Top-5 相似结果
+        start = time.time()
+        stacked = normalize_rows(np.concatenate([test['vectors'] for test in tests]))
+        verify_embedding_dimensions(library_vectors, stacked)
+        stacked_names = [name for test in tests for name in test['names']]
+        top_k_all = get_top_k_matches_batch(stacked, library_normed, library_names, k=search_k, searcher=searcher)
+        rerank_totals['search_s'] += time.time() - start
+        rerank_totals['searched'] += len(stacked_names)
+        print(f"Scored {len(stacked_names)} test functions from {len(tests)} files in one pass "
+              f"({time.time() - start:.2f}s)")
+        search_checks(stacked, top_k_all, stacked_names, "all files: ")
+        pos = 0
+        for test in tests:
+            test['top_k'] = top_k_all[pos:pos + len(test['names'])]
+            pos += len(test['names'])
+
+    for test in tests:
+        if test is None:
             continue
+        test_file, obfuscation, method = test['file'], test['obfuscation'], test['method']
+        print(f"\nProcessing test file: {os.path.join(test_folder, test_file)}")
+        if 'top_k' not in test:
+            verify_embedding_dimensions(library_vectors, test['vectors'])
+            # 计算每个待测函数的 Top-5 相似结果
+            start = time.time()
+            test_normed = normalize_rows(test['vectors'])
+            test['top_k'] = get_top_k_matches_batch(test_normed, library_normed, library_names, k=search_k,
+                                                    searcher=searcher)
+            rerank_totals['search_s'] += time.time() - start
+            rerank_totals['searched'] += len(test['names'])
+            search_checks(test_normed, test['top_k'], test['names'], "")
+        if reranker and test['names']:
+            csv_path = test_csv_path(args.csv_folder, test_file)
+            test_codes = load_codes(csv_path) if os.path.exists(csv_path) else {}
+            codes = [test_codes.get(name) for name in test['names']]
+            reranked_count = sum(code is not None for code in codes)
+            if reranked_count < len(codes):
+                print(f"  {len(codes) - reranked_count} functions not found in {csv_path} keep the vector ranking")
+            vector = detection_counts(test['top_k'], test['names'])
+            start = time.time()
+            test['top_k'] = reranker.rerank(codes, test['top_k'])
+            elapsed = time.time() - start
+            reranked = detection_counts(test['top_k'], test['names'])
+            rerank_totals['count'] += len(test['names'])
+            rerank_totals['queries'] += reranked_count
+            rerank_totals['rerank_s'] += elapsed
+            for i in range(3):
+                rerank_totals['vector'][i] += vector[i]
+                rerank_totals['reranked'][i] += reranked[i]
+            print(f"  Re-ranked {reranked_count} functions in {elapsed:.2f}s "
+                  f"({elapsed * 1000 / max(reranked_count, 1):.1f} ms/query): " + ", ".join(
+                      f"Top-{k} {r / len(test['names']):.2%} ({(r - v) / len(test['names']):+.2%})"
+                      for k, v, r in zip((1, 3, 5), vector, reranked)))
+        test['top_k'] = [top_k[:5] for top_k in test['top_k']]
+        if test['prefiltered']:
+            print(f"  {len(test['prefiltered'])} functions resolved by the fingerprint prefilter")
+            test['names'] = test['names'] + list(test['prefiltered'])
+            test['top_k'] = list(test['top_k']) + [[hit] for hit in test['prefiltered'].values()]
 
 
         if method not in results:
             results[method] = {obf: {'top-1': 0, 'top-3': 0, 'top-5': 0, 'count': 0} for obf in obfuscations}
 
-        match_results = {}
-        file_top1, file_top3, file_top5 = 0, 0, 0
-        total_tests = len(test_function)
-
-        # 计算每个待测函数的 Top-5 相似结果
-        for test_name, test_vector in test_function.items():
-            top_k_results = get_top_k_matches(test_vector, library_vectors, library_names, k=5)
-            match_results[test_name] = top_k_results
-
-            detection = evaluate_detection_rate(top_k_results, test_name)
-            file_top1 += detection[0]
-            file_top3 += detection[1]
-            file_top5 += detection[2]
+        match_results = dict(zip(test['names'], test['top_k']))
+        file_top1, file_top3, file_top5 = detection_counts(test['top_k'], test['names'])
+        total_tests = len(test['names'])
 
         # 写入当前 test_file 的结果到文本文件
         base_name = os.path.splitext(test_file)[0]
@@ -130,30 +332,40 @@ def main():
         print(f"  Top-5 Detection Rate: {file_top5 / total_tests:.2%}")
 
 
-    excel_path = os.path.join(result_folder, 'results.xlsx')
-    data = []
-    for method in results:
-        for metric in ['top-1', 'top-3', 'top-5']:
-            row = [method, metric]
-            for obf in obfuscations:
-                rate = results[method][obf][metric]
-                row.append(f"{rate:.0%}" if rate > 0 else "0%")
-            # 计算平均值
-            valid_rates = [results[method][obf][metric] for obf in obfuscations if results[method][obf]['count'] > 0]
-            avg = sum(valid_rates) / len(valid_rates) if valid_rates else 0
-            row.append(f"{avg:.0%}")
-            data.append(row)
-
+    if unreadable:
+        summary = (f"\n{len(unreadable)} test files could not be read: {', '.join(unreadable)}\n"
+                   f"Convert legacy pickled files with 'python embedding_io.py {os.path.join(test_folder, '*.npy')}' "
+                   f"or pass --allow_pickle\n")
+        if not results:
+            parser.exit(1, summary)
+        print(summary)
+
+    if compare_totals['count']:
+        print(f"\nOverall {args.quantize} vs fp32 on {compare_totals['count']} test functions:")
+        for k, f, q in zip((1, 3, 5), compare_totals['full'], compare_totals['quantized']):
+            print(f"  Top-{k}: {f / compare_totals['count']:.2%} -> {q / compare_totals['count']:.2%} "
+                  f"({(q - f) / compare_totals['count']:+.2%})")
+
+    if reranker:
+        reranker.close()
+    if rerank_totals['count']:
+        print(f"\nOverall re-ranking of the top {search_k} on {rerank_totals['count']} test functions:")
+        for k, v, r in zip((1, 3, 5), rerank_totals['vector'], rerank_totals['reranked']):
+            print(f"  Top-{k}: {v / rerank_totals['count']:.2%} -> {r / rerank_totals['count']:.2%} "
+                  f"({(r - v) / rerank_totals['count']:+.2%})")
+        print(f"  Latency: vector search {rerank_totals['search_s'] * 1000 / max(rerank_totals['searched'], 1):.3f} ms/query, "
+              f"re-ranking {rerank_totals['rerank_s'] * 1000 / max(rerank_totals['queries'], 1):.1f} ms/query")
 
     columns = ['method', 'Mterics'] + obfuscations + ['AVG']
-    df = pd.DataFrame(data, columns=columns)
-    df.set_index(['method', 'Mterics'], inplace=True)
-
-
-    with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Results')
-
-    print(f"\nExcel results saved to {excel_path}")
+    rows = detection_table(results, obfuscations)
+    if args.no_excel:
+        table_path = os.path.join(result_folder, f'results.{args.table_format}')
+        write_table(rows, columns, table_path, args.table_format)
+        print(f"\nResults table saved to {table_path}")
+    else:
+        excel_path = os.path.join(result_folder, 'results.xlsx')
+        write_excel(rows, columns, excel_path)
+        print(f"\nExcel results saved to {excel_path}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
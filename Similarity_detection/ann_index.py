@@ -0,0 +1,139 @@
+import json
+import math
+import os
+import time
+import numpy as np
+from vector_search import iter_blocks, top_k_search
+
+ANN_BACKENDS = ('hnsw', 'ivfpq')
+
+def ann_index_path(library_path, backend):
+    """Index file stored next to the library: lib_embeddings.npy -> lib_embeddings.hnsw.index"""
+    return os.path.splitext(library_path)[0] + f'.{backend}.index'
+
+def _subquantizers(dim):
+    """Largest usual PQ split of dim into sub-vectors of at least 8 dimensions"""
+    for m in (96, 64, 48, 32, 24, 16, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 8:
+            return m
+    return 1
+
+class AnnIndex:
+    """Approximate cosine top-k over an L2-normalized library.
+
+    'hnsw' uses an hnswlib graph and 'ivfpq' a faiss inverted file with
+    product quantization. search_param trades recall for latency: ef_search
+    for HNSW, nprobe for IVF-PQ. refine times k candidates are fetched and
+    re-scored exactly against the library, so reported similarities match
+    exact search and PQ approximation errors are mostly corrected.
+    """
+
+    def __init__(self, backend, index, library_normed, search_param, refine=4):
+        self.backend = backend
+        self.index = index
+        self.library_normed = library_normed
+        self.refine = max(1, refine)
+        self.set_search_param(search_param)
+
+    @classmethod
+    def build(cls, backend, library_normed, search_param, hnsw_m=32, ef_construction=200, nlist=0, seed=0):
+        """Index an L2-normalized matrix or NormalizedRows view, adding it block by block"""
+        n, dim = library_normed.shape
+        if backend == 'hnsw':
+            import hnswlib
+            index = hnswlib.Index(space='ip', dim=dim)
+            index.init_index(max_elements=n, ef_construction=ef_construction, M=hnsw_m)
+            for start, block in iter_blocks(library_normed):
+                index.add_items(block, np.arange(start, start + len(block)))
+        elif backend == 'ivfpq':
+            import faiss
+            if n < 2:
+                raise ValueError("IVF-PQ needs at least 2 library vectors")
+            nlist = nlist or max(1, min(int(4 * math.sqrt(n)), n // 39))
+            nbits = min(8, int(math.log2(n)))
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _subquantizers(dim), nbits, faiss.METRIC_INNER_PRODUCT)
+            # Training on a sample keeps a large library out of memory; 256 points per list is plenty
+            train_size = max(65536, 256 * nlist)
+            rng = np.random.default_rng(seed)
+            train = library_normed[np.sort(rng.choice(n, train_size, replace=False))] if n > train_size \
+                else library_normed[0:n]
+            index.train(np.ascontiguousarray(train, dtype=np.float32))
+            for _, block in iter_blocks(library_normed):
+                index.add(block)
+        else:
+            raise ValueError(f"Unknown ANN backend {backend}, expected one of {ANN_BACKENDS}")
+        return cls(backend, index, library_normed, search_param)
+
+    @classmethod
+    def load(cls, backend, path, library_normed, search_param):
+        if backend == 'hnsw':
+            import hnswlib
+            index = hnswlib.Index(space='ip', dim=library_normed.shape[1])
+            index.load_index(path, max_elements=library_normed.shape[0])
+        else:
+            import faiss
+            index = faiss.read_index(path)
+        return cls(backend, index, library_normed, search_param)
+
+    def save(self, path):
+        if self.backend == 'hnsw':
+            self.index.save_index(path)
+        else:
+            import faiss
+            faiss.write_index(self.index, path)
+
+    def set_search_param(self, search_param):
+        self.search_param = search_param
+        if self.backend == 'ivfpq':
+            self.index.nprobe = search_param
+
+    def search(self, queries, k=5):
+        """Same contract as vector_search.top_k_search; missing neighbours get index -1"""
+        k = min(k, self.library_normed.shape[0])
+        fetch = min(k * self.refine, self.library_normed.shape[0])
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.backend == 'hnsw':
+            self.index.set_ef(max(self.search_param, fetch))
+            candidates, _ = self.index.knn_query(queries, k=fetch)
+            candidates = candidates.astype(np.int64)
+        else:
+            _, candidates = self.index.search(queries, fetch)
+        valid = candidates >= 0
+        scores = np.einsum('nd,nkd->nk', queries, self.library_normed[np.where(valid, candidates, 0)])
+        scores = np.where(valid, scores, -np.inf).astype(np.float32)
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+def load_or_build_index(library_path, library_normed, backend, search_param, rebuild=False):
+    """Load the persisted index of the library, building and saving it when missing or stale"""
+    path = ann_index_path(library_path, backend)
+    meta_path = path + '.json'
+    meta = {'backend': backend, 'count': int(library_normed.shape[0]), 'dim': int(library_normed.shape[1]),
+            'library_mtime': os.path.getmtime(library_path)}
+    if not rebuild and os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                print(f"Loaded {backend} index from {path}")
+                return AnnIndex.load(backend, path, library_normed, search_param)
+
+    start = time.time()
+    index = AnnIndex.build(backend, library_normed, search_param)
+    index.save(path)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    print(f"Built {backend} index over {library_normed.shape[0]} functions in {time.time() - start:.1f}s, saved to {path}")
+    return index
+
+def recall_check(index, queries, k=5, sample=200, seed=0):
+    """Recall@k of the ANN index against exact search on a sample of queries, with per-query latencies"""
+    if len(queries) > sample:
+        queries = queries[np.random.default_rng(seed).choice(len(queries), sample, replace=False)]
+    start = time.perf_counter()
+    exact, _ = top_k_search(queries, index.library_normed, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+    start = time.perf_counter()
+    approx, _ = index.search(queries, k)
+    ann_ms = (time.perf_counter() - start) * 1000 / max(1, len(queries))
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx.tolist(), exact.tolist()))
+    return {'recall': hits / max(1, exact.size), 'queries': len(queries), 'ann_ms': ann_ms, 'exact_ms': exact_ms}
@@ -0,0 +1,259 @@
+import os
+import re
+import shutil
+import numpy as np
+from code_folding import SimpleCodeFolder, FOLDING_STRATEGIES
+from onnx_backend import ONNX_BACKENDS, DEFAULT_ONNX_DIR, OnnxEncoder, load_or_export
+
+DEFAULT_MODEL_PATH = "microsoft/graphcodebert-base"
+DEFAULT_SNAPSHOT_DIR = 'model_snapshots'
+POOLING_MODES = ('truncate', 'mean', 'attention')
+BACKENDS = ('torch',) + ONNX_BACKENDS
+
+def local_snapshot(model_path, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """Local copy of a hub model, saved on first use so later runs load it from disk without contacting the hub"""
+    if os.path.isdir(model_path) or not snapshot_dir:
+        return model_path
+    path = os.path.join(snapshot_dir, re.sub(r'[^\w.-]+', '_', model_path.strip('/\\')))
+    if os.path.exists(os.path.join(path, 'config.json')):
+        return path
+    from transformers import AutoTokenizer, AutoModel
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    AutoTokenizer.from_pretrained(model_path).save_pretrained(tmp_path)
+    AutoModel.from_pretrained(model_path).save_pretrained(tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Saved a local snapshot of {model_path} to {path}")
+    return path
+
+class CodeEmbedder:
+    """Batched GraphCodeBERT embedding of many functions at once.
+
+    Every function is tokenized once, folded on its token ids, and the
+    sequences are sorted by length so each batch is padded only up to its
+    own longest member. The embedding of a function is the final hidden
+    state of its CLS token, as in the one-at-a-time version.
+
+    With a folding strategy other than 'none', functions longer than
+    max_tokens are first rewritten by the AST folder and re-tokenized;
+    only what still does not fit is truncated or windowed.
+
+    backend 'onnx' or 'onnx-int8' runs the encoder through onnxruntime on
+    the CPU instead of PyTorch, exporting (and quantizing) it on first use.
+
+    With pooling 'mean' or 'attention', functions longer than max_tokens
+    are not folded but cut into overlapping windows that are batched
+    together with all other sequences; the window embeddings are then
+    pooled by a length-weighted mean, or by softmax weights from each
+    window's similarity to that mean.
+
+    torch and transformers are imported here rather than at module level,
+    so scripts that end up not embedding anything start quickly.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, device=None, max_tokens=512, batch_size=32, pooling='truncate',
+                 window_stride=384, max_windows=16, folding='none', backend='torch', onnx_dir=DEFAULT_ONNX_DIR,
+                 intra_op_threads=0, inter_op_threads=1, snapshot_dir=DEFAULT_SNAPSHOT_DIR, load_model=True):
+        from transformers import AutoConfig, AutoTokenizer, AutoModel
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+        self.model_path = model_path
+        self.backend = backend
+        # Enough to rebuild the tokenizing and folding side of this embedder in another process
+        self.planner_kwargs = {'model_path': model_path, 'max_tokens': max_tokens, 'pooling': pooling,
+                               'window_stride': window_stride, 'max_windows': max_windows, 'folding': folding,
+                               'backend': backend, 'snapshot_dir': snapshot_dir, 'load_model': False}
+        load_path = local_snapshot(model_path, snapshot_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(load_path)
+        if not load_model:
+            self.device = 'cpu'
+            self.model = None
+            self.encoder = None
+            self.dim = AutoConfig.from_pretrained(load_path).hidden_size
+        elif backend == 'torch':
+            import torch
+            self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+            print(f"Using device: {self.device}")
+            self.model = AutoModel.from_pretrained(load_path)
+            self.model.to(self.device)
+            self.model.eval()
+            self.encoder = None
+            self.dim = self.model.config.hidden_size
+        else:
+            self.device = 'cpu'
+            self.model = None
+            onnx_path = load_or_export(model_path, onnx_dir, backend, source_path=load_path)
+            self.encoder = OnnxEncoder(onnx_path, intra_op_threads, inter_op_threads)
+            self.dim = AutoConfig.from_pretrained(load_path).hidden_size
+            print(f"Using onnxruntime ({backend}) from {self.encoder.onnx_path}")
+        self.max_tokens = max_tokens
+        self.batch_size = max(1, int(batch_size))
+        if folding not in FOLDING_STRATEGIES:
+            raise ValueError(f"Unknown folding {folding}, expected one of {FOLDING_STRATEGIES}")
+        # CLS and SEP take two of the max_tokens positions
+        self.folder = SimpleCodeFolder(self.tokenizer, max_tokens=max_tokens - 2, strategy=folding)
+        if pooling not in POOLING_MODES:
+            raise ValueError(f"Unknown pooling {pooling}, expected one of {POOLING_MODES}")
+        self.pooling = pooling
+        self.window_stride = max(1, min(int(window_stride), max_tokens - 2))
+        self.max_windows = max(1, int(max_windows))
+        # Identifies everything that changes the vector of a given function
+        self.model_key = f"{model_path}|max_tokens={max_tokens}"
+        if pooling != 'truncate':
+            self.model_key += f"|pooling={pooling},stride={self.window_stride},windows={self.max_windows}"
+        if folding != 'none':
+            self.model_key += f"|folding={folding}"
+        if backend != 'torch':
+            self.model_key += f"|backend={backend}"
+
+    def tokenize(self, codes):
+        """Token ids of every function, without special tokens, in one batched tokenizer call"""
+        if not codes:
+            return []
+        ids = self.tokenizer(list(codes), add_special_tokens=False, truncation=False, verbose=False)['input_ids']
+        return [[] if not code or not code.strip() else seq for code, seq in zip(codes, ids)]
+
+    def fold_long(self, codes, id_lists):
+        """Rewrite the functions that do not fit with the AST folding strategy and re-tokenize only those"""
+        id_lists = list(id_lists)
+        long_rows = [i for i, ids in enumerate(id_lists) if len(ids) > self.max_tokens - 2]
+        if self.folder.strategy == 'none' or not long_rows:
+            return id_lists
+        folded = self.tokenize([self.folder.fold_ast(codes[i]) for i in long_rows])
+        for i, ids in zip(long_rows, folded):
+            id_lists[i] = ids
+        return id_lists
+
+    def prepare(self, ids):
+        """Fold token ids and add CLS/SEP, keeping the whole sequence within max_tokens"""
+        folded = self.folder.fold_ids(ids)
+        return [self.tokenizer.cls_token_id] + folded[:self.max_tokens - 2] + [self.tokenizer.sep_token_id]
+
+    def windows(self, ids):
+        """Sequences to embed for one function: a single folded sequence, or overlapping windows of a long one"""
+        size = self.max_tokens - 2
+        if not ids:
+            return [[]]
+        if self.pooling == 'truncate' or len(ids) <= size:
+            return [self.prepare(ids)]
+        starts = list(range(0, len(ids) - size, self.window_stride)) + [len(ids) - size]
+        if len(starts) > self.max_windows:
+            # Spread the allowed windows evenly over the function, keeping the first and the last
+            step = (len(starts) - 1) / max(1, self.max_windows - 1)
+            starts = sorted({starts[round(i * step)] for i in range(self.max_windows)})
+        cls_id, sep_id = self.tokenizer.cls_token_id, self.tokenizer.sep_token_id
+        return [[cls_id] + ids[start:start + size] + [sep_id] for start in starts]
+
+    def pool(self, vectors, lengths):
+        """Combine the window embeddings of one function"""
+        if len(vectors) == 1:
+            return vectors[0]
+        weights = np.asarray(lengths, dtype=np.float32)
+        mean = weights @ vectors / weights.sum()
+        if self.pooling == 'attention':
+            logits = vectors @ mean / np.sqrt(vectors.shape[1])
+            weights = np.exp(logits - logits.max())
+        return (weights @ vectors / weights.sum()).astype(np.float32)
+
+    def batches(self, sequences):
+        """Split sequence indices into batches of similar length to keep padding small"""
+        order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+        return [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+
+    def _forward(self, sequences):
+        width = max(len(seq) for seq in sequences)
+        input_ids = np.full((len(sequences), width), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(sequences), width), dtype=np.int64)
+        for row, seq in enumerate(sequences):
+            input_ids[row, :len(seq)] = seq
+            attention_mask[row, :len(seq)] = 1
+        if self.encoder is not None:
+            return self.encoder(input_ids, attention_mask)
+        import torch
+        with torch.inference_mode():
+            outputs = self.model(input_ids=torch.from_numpy(input_ids).to(self.device),
+                                 attention_mask=torch.from_numpy(attention_mask).to(self.device))
+        return outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
+
+    def embed_sequences(self, sequences):
+        """Embed prepared sequences, returns a float32 (n, dim) matrix; empty sequences get zero vectors"""
+        embeddings = np.zeros((len(sequences), self.dim), dtype=np.float32)
+        valid = [i for i, seq in enumerate(sequences) if seq]
+        for batch in self.batches([sequences[i] for i in valid]):
+            rows = [valid[i] for i in batch]
+            try:
+                embeddings[rows] = self._forward([sequences[i] for i in rows])
+            except Exception as e:
+                print(f"  Error embedding batch of {len(rows)}: {e}, retrying one function at a time")
+                for i in rows:
+                    try:
+                        embeddings[i] = self._forward([sequences[i]])[0]
+                    except Exception as e:
+                        print(f"  Error generating embedding: {e}, returning zero embedding")
+        return embeddings
+
+    def embed_windows(self, window_lists):
+        """Embed the windows of many functions in shared batches and pool them, one row per function"""
+        flat = [seq for windows in window_lists for seq in windows]
+        vectors = self.embed_sequences(flat)
+        embeddings = np.zeros((len(window_lists), self.dim), dtype=np.float32)
+        pos = 0
+        for row, windows in enumerate(window_lists):
+            embeddings[row] = self.pool(vectors[pos:pos + len(windows)], [len(seq) for seq in windows])
+            pos += len(windows)
+        return embeddings
+
+    def embed_ids(self, id_lists):
+
+        return self.embed_windows([self.windows(ids) for ids in id_lists])
+
+    def plan(self, codes, names=None):
+        """Tokenize, fold and window a list of functions; with names, report the ones that did not fit"""
+        token_ids = self.tokenize(codes)
+        window_lists = []
+        for i, (ids, folded) in enumerate(zip(token_ids, self.fold_long(codes, token_ids))):
+            windows = self.windows(folded)
+            window_lists.append(windows)
+            if names is None:
+                continue
+            ast_note = f"{self.folder.strategy} folding to {len(folded)} tokens, " if len(folded) < len(ids) else ""
+            if len(windows) > 1:
+                print(f"  {names[i]}: {len(ids)} tokens > {self.max_tokens}, {ast_note}"
+                      f"embedded as {len(windows)} windows with {self.pooling} pooling")
+            elif len(ids) > self.max_tokens:
+                print(f"  {names[i]}: {len(ids)} tokens > {self.max_tokens}, {ast_note}"
+                      f"folded to {len(windows[0])} tokens ({(len(ids) - len(windows[0])) / len(ids) * 100:.1f}% reduction)")
+            elif not ids:
+                print(f"  Warning: Empty code for {names[i]}, returning zero embedding")
+        return window_lists
+
+    def embed(self, codes, names=None):
+        """Embed a list of functions, returns a float32 (n, dim) matrix"""
+        return self.embed_windows(self.plan(codes, names))
+
+def add_embedder_arguments(parser):
+    """Command line options of CodeEmbedder, shared by the scripts that embed functions"""
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Model name or local path")
+    parser.add_argument('--snapshot_dir', default=DEFAULT_SNAPSHOT_DIR,
+                        help="Local copies of hub models, loaded instead of the hub on later runs ('' disables)")
+    parser.add_argument('--batch_size', type=int, default=32, help="Functions per forward pass")
+    parser.add_argument('--max_tokens', type=int, default=512, help="Token limit after folding")
+    parser.add_argument('--device', default=None, help="Torch device, defaults to cuda when available")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="PyTorch, or onnxruntime on the CPU at fp32 or with dynamic int8 quantization")
+    parser.add_argument('--onnx_dir', default=DEFAULT_ONNX_DIR, help="Folder of exported ONNX models")
+    parser.add_argument('--intra_op_threads', type=int, default=0, help="onnxruntime threads per operator, 0 uses all cores")
+    parser.add_argument('--inter_op_threads', type=int, default=1, help="onnxruntime threads across operators")
+    parser.add_argument('--long_functions', choices=POOLING_MODES, default='truncate',
+                        help="Fold functions over --max_tokens, or embed overlapping windows pooled by mean or attention")
+    parser.add_argument('--folding', choices=FOLDING_STRATEGIES, default='none',
+                        help="AST folding of functions over --max_tokens before truncation or windowing")
+    parser.add_argument('--window_stride', type=int, default=384, help="Tokens between consecutive window starts")
+    parser.add_argument('--max_windows', type=int, default=16, help="Windows per function, spread evenly when exceeded")
+
+def embedder_from_args(args):
+
+    return CodeEmbedder(args.model, args.device, args.max_tokens, args.batch_size, args.long_functions,
+                        args.window_stride, args.max_windows, args.folding, backend=args.backend,
+                        onnx_dir=args.onnx_dir, intra_op_threads=args.intra_op_threads,
+                        inter_op_threads=args.inter_op_threads, snapshot_dir=args.snapshot_dir)
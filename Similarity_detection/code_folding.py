@@ -0,0 +1,288 @@
+import functools
+import operator
+import os
+import re
+
+CUR_DIR = os.path.dirname(os.path.abspath(__file__))
+TREE_SITTER_C_LIB = os.environ.get(
+    'TREE_SITTER_C_LIB',
+    os.path.join(CUR_DIR, '..', 'Code_Similarity_Evaluate', 'tree-sitter-c', 'build', 'my-languages.dll')
+)
+
+# AST strategies ordered by how much meaning they drop; 'all' applies them in this order until the code fits
+AST_STRATEGIES = ('dead_branches', 'repeated_blocks', 'constant_tables')
+FOLDING_STRATEGIES = ('none',) + AST_STRATEGIES + ('all',)
+
+BINARY_OPS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '&': operator.and_, '|': operator.or_,
+    '^': operator.xor, '<<': operator.lshift, '>>': operator.rshift, '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '>': operator.gt, '<=': operator.le, '>=': operator.ge,
+}
+CONSTANT_TYPES = ('number_literal', 'char_literal', 'string_literal', 'true', 'false', 'null')
+MIN_TABLE_ELEMENTS = 8
+MIN_STORE_RUN = 6
+MIN_STRING_LENGTH = 48
+MIN_DUPLICATE_LENGTH = 80
+
+@functools.lru_cache(maxsize=1)
+def get_parser():
+    """tree-sitter C parser, or None when the grammar library cannot be loaded"""
+    try:
+        from tree_sitter import Language, Parser
+        parser = Parser()
+        parser.set_language(Language(TREE_SITTER_C_LIB, 'c'))
+        return parser
+    except Exception as e:
+        print(f"Warning: tree-sitter C grammar unavailable ({e}), AST folding disabled")
+        return None
+
+def _text(node, src):
+    return src[node.start_byte:node.end_byte].decode('utf-8', errors='replace')
+
+def _signature(node, src):
+    """Statement text with whitespace and numeric constants abstracted, so unrolled copies compare equal"""
+    return re.sub(r'\b(0[xX][0-9a-fA-F]+|\d+)[uUlL]*\b', 'N', re.sub(r'\s+', '', _text(node, src)))
+
+def _apply_edits(src, edits):
+    """Replace (start, end, text) byte ranges, skipping ranges nested in an earlier edit"""
+    result, pos = [], 0
+    for start, end, text in sorted(edits, key=lambda e: (e[0], -e[1])):
+        if start < pos:
+            continue
+        result += [src[pos:start], text.encode('utf-8')]
+        pos = end
+    result.append(src[pos:])
+    return b''.join(result)
+
+def _unwrap(node):
+    while node is not None and node.type == 'parenthesized_expression' and node.named_child_count == 1:
+        node = node.named_children[0]
+    return node
+
+def _int_literal(text):
+    text = text.rstrip('uUlL')
+    try:
+        return int(text, 0)
+    except ValueError:
+        return int(text, 8) if re.fullmatch(r'0[0-7]+', text) else None
+
+def _is_even_product(node, src):
+    """x * (x + 1) or x * (x - 1), the usual opaque predicate of bogus control flow"""
+    node = _unwrap(node)
+    if node is None or node.type != 'binary_expression' or _text(node.child_by_field_name('operator'), src) != '*':
+        return False
+    sides = [_unwrap(node.child_by_field_name('left')), _unwrap(node.child_by_field_name('right'))]
+    for x, pair in (sides, sides[::-1]):
+        if pair is None or pair.type != 'binary_expression' or _text(pair.child_by_field_name('operator'), src) not in '+-':
+            continue
+        name = re.sub(r'\s+', '', _text(x, src))
+        left, right = _unwrap(pair.child_by_field_name('left')), _unwrap(pair.child_by_field_name('right'))
+        for a, b in ((left, right), (right, left)):
+            if re.sub(r'\s+', '', _text(a, src)) == name and _text(b, src).strip() == '1':
+                return True
+    return False
+
+def _const_value(node, src):
+    """Integer value of a condition when it is decidable without running the code, else None"""
+    node = _unwrap(node)
+    if node is None:
+        return None
+    if node.type == 'number_literal':
+        return _int_literal(_text(node, src))
+    if node.type in ('true', 'false'):
+        return int(node.type == 'true')
+    if node.type == 'unary_expression':
+        value = _const_value(node.child_by_field_name('argument'), src)
+        op = _text(node.child_by_field_name('operator'), src)
+        if value is None:
+            return None
+        return {'!': int(not value), '-': -value, '~': ~value, '+': value}.get(op)
+    if node.type != 'binary_expression':
+        return None
+
+    op = _text(node.child_by_field_name('operator'), src)
+    left, right = node.child_by_field_name('left'), node.child_by_field_name('right')
+    rv = _const_value(right, src)
+    if (op == '%' and rv == 2 or op == '&' and rv == 1) and _is_even_product(left, src):
+        return 0
+    lv = _const_value(left, src)
+    if op == '||':
+        if lv or rv:
+            return 1
+        return 0 if lv is not None and rv is not None else None
+    if op == '&&':
+        if lv == 0 or rv == 0:
+            return 0
+        return 1 if lv is not None and rv is not None else None
+    if lv is None or rv is None:
+        return None
+    if op in ('/', '%'):
+        if rv == 0:
+            return None
+        return int(lv / rv) if op == '/' else lv - int(lv / rv) * rv
+    if op in ('<<', '>>') and not 0 <= rv < 64:
+        return None
+    return int(BINARY_OPS[op](lv, rv)) if op in BINARY_OPS else None
+
+def _walk(node):
+    yield node
+    for child in node.children:
+        yield from _walk(child)
+
+def _statements(block):
+    return [child for child in block.named_children if child.type != 'comment']
+
+class SimpleCodeFolder:
+    """Folds functions that exceed max_tokens.
+
+    'none' only truncates. The AST strategies rewrite the code with the
+    tree-sitter C grammar before anything is truncated: 'dead_branches'
+    removes branches whose condition is constant, including opaque
+    predicates such as x * (x - 1) % 2 == 0; 'repeated_blocks' keeps one
+    copy of repeated statement runs and duplicated blocks; 'constant_tables'
+    shortens long initializer lists, string literals and runs of constant
+    stores. 'all' applies them in that order and stops as soon as the
+    function fits.
+    """
+
+    def __init__(self, tokenizer, max_tokens=512, strategy='none'):
+        if strategy not in FOLDING_STRATEGIES:
+            raise ValueError(f"Unknown folding strategy {strategy}, expected one of {FOLDING_STRATEGIES}")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.strategies = AST_STRATEGIES if strategy == 'all' else () if strategy == 'none' else (strategy,)
+
+    def fold_ids(self, ids):
+        """Fold an already tokenized function (token ids without special tokens), returns the folded ids"""
+        return self._no_folding_ids(ids)
+
+    def count_tokens(self, code):
+        return len(self.tokenizer.tokenize(code))
+
+    def fold_ast(self, code):
+        """Apply the AST strategies in turn until the code fits in max_tokens, returns the rewritten code"""
+        if not self.strategies or self.count_tokens(code) <= self.max_tokens:
+            return code
+        parser = get_parser()
+        if parser is None:
+            return code
+        for name in self.strategies:
+            try:
+                code = getattr(self, f'_fold_{name}')(parser, code)
+            except Exception as e:
+                print(f"  Error in {name} folding: {e}, skipping it")
+            if self.count_tokens(code) <= self.max_tokens:
+                break
+        return code
+
+    def _fold_dead_branches(self, parser, code, max_passes=4):
+        """Drop if/while branches whose condition is a constant or an opaque predicate"""
+        src = code.encode('utf-8')
+        for _ in range(max_passes):
+            edits = []
+            for node in _walk(parser.parse(src).root_node):
+                if node.type not in ('if_statement', 'while_statement', 'do_statement'):
+                    continue
+                value = _const_value(node.child_by_field_name('condition'), src)
+                if value is None:
+                    continue
+                body = node.child_by_field_name('consequence') or node.child_by_field_name('body')
+                if node.type == 'if_statement':
+                    alternative = node.child_by_field_name('alternative')
+                    if alternative is not None and alternative.type == 'else_clause':
+                        alternative = alternative.named_children[-1] if alternative.named_children else None
+                    kept = body if value else alternative
+                    edits.append((node.start_byte, node.end_byte, _text(kept, src) if kept is not None else ';'))
+                elif node.type == 'while_statement' and not value:
+                    edits.append((node.start_byte, node.end_byte, ';'))
+                elif node.type == 'do_statement' and not value:
+                    edits.append((node.start_byte, node.end_byte, _text(body, src)))
+            if not edits:
+                break
+            src = _apply_edits(src, edits)
+        return src.decode('utf-8', errors='replace')
+
+    def _fold_repeated_blocks(self, parser, code, max_period=8):
+        """Keep the first copy of consecutively repeated statement runs and of duplicated large blocks"""
+        src = code.encode('utf-8')
+        tree = parser.parse(src)
+        edits = []
+        for block in _walk(tree.root_node):
+            if block.type != 'compound_statement':
+                continue
+            stmts = _statements(block)
+            sigs = [_signature(stmt, src) for stmt in stmts]
+            i = 0
+            while i < len(stmts):
+                best = (0, 0)
+                for period in range(1, min(max_period, (len(stmts) - i) // 2) + 1):
+                    reps = 1
+                    while sigs[i + reps * period:i + (reps + 1) * period] == sigs[i:i + period]:
+                        reps += 1
+                    if (reps - 1) * period > best[0] * best[1] and (reps - 1) * period >= 2:
+                        best = (reps - 1, period)
+                if best[0]:
+                    extra, period = best
+                    first, last = stmts[i + period], stmts[i + (extra + 1) * period - 1]
+                    edits.append((first.start_byte, last.end_byte, f"/* repeated {extra} more times */"))
+                    i += (extra + 1) * period
+                else:
+                    i += 1
+
+        seen = set()
+        for node in _walk(tree.root_node):
+            if node.type != 'compound_statement' or node.end_byte - node.start_byte < MIN_DUPLICATE_LENGTH:
+                continue
+            sig = _signature(node, src)
+            if sig in seen:
+                edits.append((node.start_byte, node.end_byte, "{ /* duplicate block */ }"))
+            seen.add(sig)
+        return _apply_edits(src, edits).decode('utf-8', errors='replace')
+
+    def _fold_constant_tables(self, parser, code, keep=4):
+        """Shorten long initializer lists, long string literals and runs of constant stores"""
+        src = code.encode('utf-8')
+        tree = parser.parse(src)
+        edits = []
+        for node in _walk(tree.root_node):
+            if node.type == 'initializer_list' and node.named_child_count > MIN_TABLE_ELEMENTS:
+                items = [_text(item, src) for item in node.named_children[:keep]]
+                edits.append((node.start_byte, node.end_byte,
+                              "{" + ", ".join(items) + f", /* +{node.named_child_count - keep} */}}"))
+            elif node.type == 'string_literal' and node.end_byte - node.start_byte > MIN_STRING_LENGTH:
+                text = _text(node, src)[:MIN_STRING_LENGTH // 2].rstrip('\\')
+                edits.append((node.start_byte, node.end_byte, text + '..."'))
+            elif node.type == 'compound_statement':
+                run = []
+                for stmt in _statements(node) + [None]:
+                    base = self._constant_store_base(stmt, src)
+                    if base is not None and (not run or base == run[0][0]):
+                        run.append((base, stmt))
+                        continue
+                    if len(run) >= MIN_STORE_RUN:
+                        edits.append((run[keep][1].start_byte, run[-1][1].end_byte,
+                                      f"/* +{len(run) - keep} constant stores */"))
+                    run = [(base, stmt)] if base is not None else []
+        return _apply_edits(src, edits).decode('utf-8', errors='replace')
+
+    def _constant_store_base(self, stmt, src):
+        """Base variable of a statement such as buf[3] = 0x41; or p->x = 'a';, else None"""
+        if stmt is None or stmt.type != 'expression_statement' or not stmt.named_children:
+            return None
+        expr = stmt.named_children[0]
+        if expr.type != 'assignment_expression':
+            return None
+        target, value = expr.child_by_field_name('left'), _unwrap(expr.child_by_field_name('right'))
+        if value is None or target is None:
+            return None
+        if value.type == 'unary_expression':
+            value = value.child_by_field_name('argument')
+        if value.type not in CONSTANT_TYPES:
+            return None
+        match = re.match(r'[\s*(]*([A-Za-z_]\w*)', _text(target, src))
+        return match.group(1) if match else None
+
+    def _no_folding_ids(self, ids):
+        """No folding, return the ids truncated to max_tokens"""
+        return list(ids[:self.max_tokens])
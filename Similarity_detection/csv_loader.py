@@ -0,0 +1,78 @@
+import codecs
+import csv
+import re
+import sys
+from collections import Counter
+
+SNIFF_BYTES = 1024 * 1024
+UNESCAPE = re.compile(r'\\([nt])')
+UNESCAPED = {'n': '\n', 't': '\t'}
+MAX_EXAMPLES = 5
+
+# Decompiled functions can be far longer than the csv module's default field limit
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+def sniff_encoding(path, prefix_bytes=SNIFF_BYTES):
+    """Encoding of a CSV file decided from its first bytes: utf-8 (with or without BOM) if they decode, else latin-1"""
+    with open(path, 'rb') as f:
+        prefix = f.read(prefix_bytes)
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # Incremental decoding tolerates a multi-byte character cut at the end of the prefix
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+def unescape(code):
+    """Turn the literal \\n and \\t escapes of the CSV code column into newlines and tabs in one pass"""
+    return UNESCAPE.sub(lambda match: UNESCAPED[match.group(1)], code)
+
+class LoadReport:
+    """Counts of the rows of one CSV file that were loaded or rejected, with a few example line numbers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.encoding = None
+        self.accepted = 0
+        self.rejected = Counter()
+        self.examples = {}
+        self.replaced = 0
+
+    def reject(self, line, reason):
+        self.rejected[reason] += 1
+        examples = self.examples.setdefault(reason, [])
+        if len(examples) < MAX_EXAMPLES:
+            examples.append(line)
+
+    def format(self):
+        text = f"Preprocessed {self.accepted} functions from {self.path} using {self.encoding} encoding."
+        if self.replaced:
+            text += f" {self.replaced} rows had undecodable bytes replaced."
+        for reason, count in self.rejected.most_common():
+            text += f"\n  Rejected {count} rows with {reason} (lines {', '.join(map(str, self.examples[reason]))}" \
+                    f"{', ...' if count > MAX_EXAMPLES else ''})"
+        return text
+
+def iter_functions(path, report=None, encoding=None):
+    """Stream {"id", "function_name", "code"} rows of a function CSV, skipping its header.
+
+    The file is read once with the sniffed encoding. Rows without exactly
+    three columns are counted in report instead of being dropped silently.
+    """
+    report = report or LoadReport(path)
+    report.encoding = encoding or sniff_encoding(path)
+    with open(path, 'r', encoding=report.encoding, errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != 3:
+                report.reject(reader.line_num, f"{len(row)} columns")
+                continue
+            if '\ufffd' in row[2]:
+                report.replaced += 1
+            report.accepted += 1
+            yield {"id": row[0].strip(), "function_name": row[1].strip(), "code": unescape(row[2])}
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+
+INDEX_SUFFIX = '.index.json'
+
+def index_path(npy_path):
+    """Name index stored next to an embedding matrix: x_embeddings.npy -> x_embeddings.index.json"""
+    return os.path.splitext(npy_path)[0] + INDEX_SUFFIX
+
+def save_embeddings(npy_path, names, matrix, dtype='float32'):
+    """Save a contiguous (n, dim) matrix as a plain .npy file plus a JSON name index"""
+    matrix = np.asarray(matrix)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(names), -1)
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    tmp_path = npy_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(tmp_path, npy_path)
+    write_index(npy_path, names, matrix.shape[1], matrix.dtype)
+
+def write_index(npy_path, names, dim, dtype):
+
+    index = {'names': list(names), 'dim': int(dim), 'dtype': np.dtype(dtype).name}
+    with open(index_path(npy_path) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(index_path(npy_path) + '.tmp', index_path(npy_path))
+
+class EmbeddingWriter:
+    """Write an embedding matrix and its name index chunk by chunk, without holding the matrix in memory.
+
+    Rows go to a raw .part file and close() prepends the .npy header. A name
+    appended twice keeps its first position and its last vector, as when
+    the embeddings were collected in a dict.
+    """
+
+    def __init__(self, npy_path, dim, dtype='float32'):
+        self.npy_path = npy_path
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.names = []
+        self._rows = {}
+        self._part = open(npy_path + '.part', 'w+b')
+
+    def append(self, names, matrix):
+        matrix = np.ascontiguousarray(np.asarray(matrix).reshape(len(names), self.dim), dtype=self.dtype)
+        if not any(name in self._rows for name in names) and len(set(names)) == len(names):
+            self._rows.update((name, len(self.names) + i) for i, name in enumerate(names))
+            self.names.extend(names)
+            self._part.write(matrix.tobytes())
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        for name, row in zip(names, matrix):
+            if name not in self._rows:
+                self._rows[name] = len(self.names)
+                self.names.append(name)
+            self._part.seek(self._rows[name] * row_bytes)
+            self._part.write(row.tobytes())
+        self._part.seek(0, os.SEEK_END)
+
+    def close(self):
+        """Finish the .npy file and its index, returns the number of rows"""
+        self._part.flush()
+        self._part.seek(0)
+        tmp_path = self.npy_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(self.dtype),
+                                                     'fortran_order': False, 'shape': (len(self.names), self.dim)})
+            shutil.copyfileobj(self._part, f, 16 * 1024 * 1024)
+        self._part.close()
+        os.remove(self.npy_path + '.part')
+        os.replace(tmp_path, self.npy_path)
+        write_index(self.npy_path, self.names, self.dim, self.dtype)
+        return len(self.names)
+
+def save_embedding_dict(npy_path, embeddings, dtype='float32'):
+
+    names = list(embeddings.keys())
+    matrix = np.stack([np.asarray(v).squeeze() for v in embeddings.values()]) if names else np.zeros((0, 0))
+    save_embeddings(npy_path, names, matrix, dtype)
+
+def load_legacy(npy_path):
+    """Names and matrix from the old pickled {name: vector} .npy format (unpickles the file)"""
+    data = np.load(npy_path, allow_pickle=True).item()
+    names = list(data.keys())
+    if not names:
+        return names, np.zeros((0, 0), dtype=np.float32)
+    return names, np.stack([np.asarray(v, dtype=np.float32).squeeze() for v in data.values()])
+
+def load_embedding_matrix(npy_path, mmap=True, allow_pickle=False):
+    """Load (names, matrix); the matrix is memory-mapped read-only unless mmap is False.
+
+    Files in the old pickled dict format are only read when allow_pickle is
+    set, since unpickling can run arbitrary code.
+    """
+    if os.path.exists(index_path(npy_path)):
+        with open(index_path(npy_path), 'r', encoding='utf-8') as f:
+            names = json.load(f)['names']
+        matrix = np.load(npy_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+        if matrix.ndim != 2 or matrix.shape[0] != len(names):
+            raise ValueError(f"{npy_path}: matrix shape {matrix.shape} does not match {len(names)} indexed names")
+        return names, matrix
+    if allow_pickle:
+        print(f"Warning: {npy_path} has no name index, loading it as a legacy pickled dict")
+        return load_legacy(npy_path)
+    raise ValueError(f"{npy_path} has no {INDEX_SUFFIX} name index. If it is a legacy pickled dict, "
+                     f"convert it with 'python embedding_io.py {npy_path}' or pass --allow_pickle")
+
+def convert_legacy(npy_path, output_path=None, dtype='float32'):
+    """Rewrite a legacy pickled embedding file as matrix + name index, returns the number of vectors"""
+    names, matrix = load_legacy(npy_path)
+    save_embeddings(output_path or npy_path, names, matrix, dtype)
+    return len(names)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert legacy pickled embedding .npy files to matrix + name index",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('files', nargs='+', help="Pickled {name: vector} .npy files, converted in place")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32', help="Stored precision")
+    args = parser.parse_args()
+
+    for npy_path in args.files:
+        if os.path.exists(index_path(npy_path)):
+            print(f"Skipping {npy_path}: already converted")
+            continue
+        count = convert_legacy(npy_path, dtype=args.dtype)
+        print(f"Converted {npy_path}: {count} vectors, index in {index_path(npy_path)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from embedding_io import EmbeddingWriter
+from fingerprint import prefilter_path
+
+_planner = None
+
+def chunked(iterable, size):
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _init_planner(planner_kwargs):
+    global _planner
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    from code_embedder import CodeEmbedder
+    _planner = CodeEmbedder(**planner_kwargs)
+
+def _plan_chunk(codes, names):
+    return _planner.plan(codes, names)
+
+class EmbeddingPipeline:
+    """Streaming CSV -> tokenize -> batch -> infer -> write pipeline.
+
+    Rows are read in chunks of chunk_size. Chunks are tokenized, folded and
+    windowed in worker processes while the main process runs inference on
+    earlier chunks; at most prefetch chunks wait ahead of the model. Every
+    finished chunk goes to the embedding store and is appended to its
+    file's .npy matrix, so only a few chunks are ever held in memory.
+    With workers=0, or with a remote embedding worker, chunks are embedded
+    in the main process.
+
+    With a fingerprint prefilter, functions it resolves to a library entry
+    are not embedded at all; they are listed in the file's .prefilter.json
+    next to the .npy, where 2-detection.py picks them up.
+    """
+
+    def __init__(self, embedder, store=None, dtype='float32', workers=2, chunk_size=1024, prefetch=2, prefilter=None):
+        self.embedder = embedder
+        self.store = store
+        self.prefilter = prefilter
+        self.dtype = dtype
+        self.chunk_size = max(1, chunk_size)
+        self.prefetch = max(1, prefetch)
+        self.seen_keys = set()
+        self.pool = None
+        if workers > 0 and hasattr(embedder, 'planner_kwargs'):
+            # Spawned rather than forked, so workers do not inherit the model or its thread pools
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_planner, initargs=(embedder.planner_kwargs,))
+
+    def run(self, sources):
+        """Embed (rows, npy_path) sources in order; rows may be any iterable of CSV row dicts"""
+        pending = deque()
+        for rows, npy_path in sources:
+            writer = EmbeddingWriter(npy_path, self.embedder.dim, self.dtype)
+            counts = {'reused': 0, 'embedded': 0, 'start': time.time(), 'hits': {}}
+            for chunk in chunked(rows, self.chunk_size):
+                pending.append(self._submit(chunk, writer, counts))
+                while len(pending) > self.prefetch:
+                    self._finish(*pending.popleft())
+            pending.append((None, writer, counts))
+        while pending:
+            self._finish(*pending.popleft())
+
+    def _submit(self, rows, writer, counts):
+        if self.prefilter:
+            kept = []
+            for row in rows:
+                hit = self.prefilter.lookup(row['code'])
+                if hit:
+                    counts['hits'][row['function_name']] = {'match': hit[0], 'kind': hit[1], 'score': hit[2]}
+                    if self.store:
+                        # Not embedded this time, but still in use: --prune_store must keep its embedding
+                        self.seen_keys.add(self.store.make_key(row['code']))
+                else:
+                    kept.append(row)
+            rows = kept
+        keys = [self.store.make_key(row['code']) for row in rows] if self.store else list(range(len(rows)))
+        stored = self.store.get_many(keys) if self.store else {}
+        todo = [i for i, key in enumerate(keys) if key not in stored]
+        if self.store:
+            self.seen_keys.update(keys)
+        codes = [rows[i]['code'] for i in todo]
+        names = [rows[i]['function_name'] for i in todo]
+        future = self.pool.submit(_plan_chunk, codes, names) if self.pool and todo else None
+        counts['reused'] += len(rows) - len(todo)
+        counts['embedded'] += len(todo)
+        return {'rows': rows, 'keys': keys, 'stored': stored, 'todo': todo, 'future': future}, writer, counts
+
+    def _finish(self, job, writer, counts):
+        if job is None:
+            total = writer.close()
+            elapsed = time.time() - counts['start']
+            print(f"Saved {total} embeddings to {writer.npy_path}: reused {counts['reused']}, embedded {counts['embedded']} "
+                  f"in {elapsed:.1f}s ({counts['embedded'] / max(elapsed, 1e-9):.1f} functions/s)")
+            self._write_hits(writer.npy_path, counts['hits'])
+            return
+
+        rows, keys, stored, todo = job['rows'], job['keys'], job['stored'], job['todo']
+        if job['future'] is not None:
+            matrix = self.embedder.embed_windows(job['future'].result())
+        else:
+            matrix = self.embedder.embed([rows[i]['code'] for i in todo], [rows[i]['function_name'] for i in todo])
+        if self.store:
+            # Zero vectors mark failures and are not worth keeping
+            self.store.put_many((keys[i], embedding) for i, embedding in zip(todo, matrix) if embedding.any())
+        stored.update((keys[i], embedding) for i, embedding in zip(todo, matrix))
+        writer.append([row['function_name'] for row in rows], [stored[key] for key in keys])
+
+    def _write_hits(self, npy_path, hits):
+        path = prefilter_path(npy_path)
+        if not self.prefilter:
+            # Hits of an earlier prefiltered run would hide functions that are now in the .npy
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(hits, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        kinds = [hit['kind'] for hit in hits.values()]
+        print(f"Prefilter resolved {len(hits)} functions without embedding them ("
+              + ", ".join(f"{kinds.count(kind)} {kind}" for kind in ('exact', 'normalized', 'minhash')) + f"), see {path}")
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
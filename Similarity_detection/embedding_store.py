@@ -0,0 +1,78 @@
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+class EmbeddingStore:
+    """Persistent embedding store keyed by a content hash of the function code and the model.
+
+    Every vector is one row of a SQLite file, so adding or deleting entries
+    only touches those rows instead of rewriting the whole store.
+    """
+
+    def __init__(self, db_path, model_key):
+        self.db_path = db_path
+        self.model_key = model_key
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_model ON embeddings(model)")
+        self._conn.commit()
+
+    def make_key(self, code):
+        return hashlib.sha256(f"{self.model_key}\n{code}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys, chunk_size=500):
+        """Look up keys, returns a dict key -> float32 vector for the ones that are stored"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs in one transaction"""
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created) VALUES (?, ?, ?, ?, ?)",
+            [(key, self.model_key, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+             for key, vector in items]
+        )
+        self._conn.commit()
+
+    def delete_many(self, keys):
+        """Remove keys from the store, returns the number of deleted entries"""
+        cursor = self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key in keys])
+        self._conn.commit()
+        return cursor.rowcount
+
+    def keys(self):
+        """All keys stored for this model"""
+        return {row[0] for row in self._conn.execute("SELECT key FROM embeddings WHERE model = ?", (self.model_key,))}
+
+    def prune(self, keep_keys):
+        """Delete the entries of this model whose key is not in keep_keys"""
+        stale = self.keys() - set(keep_keys)
+        return self.delete_many(stale) if stale else 0
+
+    def stats(self):
+        entries = self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_key,)).fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        self._conn.close()
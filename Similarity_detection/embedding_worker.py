@@ -0,0 +1,128 @@
+import argparse
+import base64
+import contextlib
+import json
+import socket
+import socketserver
+import sys
+import threading
+import numpy as np
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+def encode_matrix(matrix):
+    """float32 matrix as a JSON-safe dict; base64 keeps the exact bits and is much smaller than a list of floats"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    return {'shape': list(matrix.shape), 'data': base64.b64encode(matrix.tobytes()).decode('ascii')}
+
+def decode_matrix(encoded):
+
+    return np.frombuffer(base64.b64decode(encoded['data']), dtype=np.float32).reshape(encoded['shape'])
+
+def handle_request(embedder, request):
+    """Answer one request: {"op": "info"} or {"op": "embed", "codes": [...], "names": [...]}"""
+    op = request.get('op', 'embed')
+    if op == 'info':
+        return {'model_key': embedder.model_key, 'dim': embedder.dim, 'max_tokens': embedder.max_tokens}
+    if op == 'embed':
+        return {'embeddings': encode_matrix(embedder.embed(request['codes'], request.get('names')))}
+    raise ValueError(f"Unknown op {op}")
+
+def respond(embedder, line, lock):
+    """JSON response line to one request line; failures are reported in an "error" field"""
+    request = {}
+    try:
+        request = json.loads(line)
+        with lock:
+            response = handle_request(embedder, request)
+    except Exception as e:
+        response = {'error': f"{type(e).__name__}: {e}"}
+    response['id'] = request.get('id') if isinstance(request, dict) else None
+    return json.dumps(response) + '\n'
+
+def serve_stdio(embedder):
+    """One JSON request per stdin line, one response per stdout line; progress output goes to stderr"""
+    out = sys.stdout
+    lock = threading.Lock()
+    with contextlib.redirect_stdout(sys.stderr):
+        for line in sys.stdin:
+            if line.strip():
+                out.write(respond(embedder, line, lock))
+                out.flush()
+
+def serve_socket(embedder, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Same line protocol over TCP; clients are served in threads but the model runs one request at a time"""
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(respond(embedder, line, lock).encode('utf-8'))
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), Handler) as server:
+        server.daemon_threads = True
+        print(f"Embedding worker listening on {host}:{port} ({embedder.model_key})")
+        server.serve_forever()
+
+def parse_address(address):
+
+    host, _, port = address.rpartition(':')
+    return host or DEFAULT_HOST, int(port)
+
+class EmbeddingClient:
+    """Client of a running socket worker, with the embed() and model_key of the CodeEmbedder behind it"""
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self._sock = socket.create_connection(parse_address(address), timeout=timeout)
+        self._file = self._sock.makefile('rwb')
+        info = self._call({'op': 'info'})
+        self.model_key = info['model_key']
+        self.dim = info['dim']
+        self.max_tokens = info['max_tokens']
+
+    def _call(self, request):
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError(f"Embedding worker at {self.address} closed the connection")
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f"Embedding worker error: {response['error']}")
+        return response
+
+    def embed(self, codes, names=None):
+        """Embed a list of functions in the worker, returns a float32 (n, dim) matrix"""
+        if not codes:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return decode_matrix(self._call({'op': 'embed', 'codes': list(codes), 'names': names})['embeddings'])
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+def main():
+    from code_embedder import add_embedder_arguments, embedder_from_args
+
+    parser = argparse.ArgumentParser(description="Keep GraphCodeBERT loaded and embed functions on request",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--stdio', action='store_true', help="Serve JSON lines on stdin/stdout instead of a socket")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on")
+    add_embedder_arguments(parser)
+    args = parser.parse_args()
+
+    if args.stdio:
+        with contextlib.redirect_stdout(sys.stderr):
+            embedder = embedder_from_args(args)
+        serve_stdio(embedder)
+    else:
+        serve_socket(embedder_from_args(args), args.host, args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import zlib
+import numpy as np
+from code_folding import get_parser
+
+PREFILTER_SUFFIX = '.prefilter.json'
+MINHASH_PRIME = 4294967311
+C_KEYWORDS = {
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else', 'enum', 'extern',
+    'float', 'for', 'goto', 'if', 'inline', 'int', 'long', 'register', 'restrict', 'return', 'short', 'signed',
+    'sizeof', 'static', 'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile', 'while', 'bool',
+}
+CALLEE_PATTERN = re.compile(r'\s*\(')
+TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[A-Za-z_]\w*|0[xX][0-9a-fA-F]+\w*|\d+\w*'
+                           r'|->|\+\+|--|<<=|>>=|&&|\|\||<<|>>|[-+*/%&|^!=<>]=|\S')
+
+def prefilter_path(npy_path):
+    """Prefilter hits stored next to a test embedding file: x_embeddings.npy -> x_embeddings.prefilter.json"""
+    return os.path.splitext(npy_path)[0] + PREFILTER_SUFFIX
+
+def normalized_tokens(code):
+    """Tokens of a function with every identifier replaced by VAR, as extract_tokens in similarity.py does.
+
+    Unlike extract_tokens, keywords, types and punctuation are kept, so only
+    renaming and layout are abstracted away. Called functions keep their
+    names, as similarity.py does for calls, so memcpy(a, b, n) and
+    strncpy(a, b, n) differ. Falls back to a regular expression lexer when
+    the tree-sitter grammar is unavailable.
+    """
+    parser = get_parser()
+    if parser is None:
+        # Only names called inside the body are callees; the one before the parameter list is the function's own
+        body = code.find('{')
+        return ['VAR' if re.match(r'[A-Za-z_]', match.group()) and match.group() not in C_KEYWORDS
+                and not (0 <= body < match.start() and CALLEE_PATTERN.match(code, match.end())) else match.group()
+                for match in TOKEN_PATTERN.finditer(code)]
+    tokens = []
+    callees = set()
+    stack = [parser.parse(code.encode('utf-8')).root_node]
+    while stack:
+        node = stack.pop()
+        if node.type == 'comment':
+            continue
+        if node.type == 'call_expression':
+            callee = node.child_by_field_name('function')
+            if callee is not None and callee.type == 'identifier':
+                callees.add(callee.id)
+        if node.type == 'identifier':
+            tokens.append(node.text.decode('utf-8', errors='replace') if node.id in callees else 'VAR')
+        elif node.child_count == 0:
+            tokens.append(node.text.decode('utf-8', errors='replace'))
+        else:
+            stack.extend(reversed(node.children))
+    return tokens
+
+def exact_hash(code):
+
+    return hashlib.blake2b(re.sub(r'\s+', ' ', code.strip()).encode('utf-8'), digest_size=16).hexdigest()
+
+def token_hash(tokens):
+
+    return hashlib.blake2b(' '.join(tokens).encode('utf-8'), digest_size=16).hexdigest()
+
+class FingerprintIndex:
+    """Hash lookup of library functions to resolve test functions without embedding them.
+
+    A test function is resolved when its whitespace-normalized code or its
+    VAR-abstracted token sequence hashes to exactly one library function,
+    or when MinHash/LSH finds a single library function whose estimated
+    token-shingle Jaccard similarity reaches threshold. All lookups are
+    dictionary probes; ambiguous hashes resolve nothing.
+    """
+
+    def __init__(self, num_perm=64, bands=8, shingle=4, threshold=0.9, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        self.threshold = threshold
+        self.names = []
+        self.signatures = []
+        self.exact = {}
+        self.normalized = {}
+        self.buckets = {}
+
+    @classmethod
+    def build(cls, functions, **kwargs):
+        """Index (name, code) pairs"""
+        index = cls(**kwargs)
+        for name, code in functions:
+            index.add(name, code)
+        return index
+
+    def signature(self, tokens):
+        """MinHash signature of the token shingles"""
+        size = min(self.shingle, len(tokens))
+        shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        x = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    @staticmethod
+    def _claim(table, key, name):
+        # A hash shared by differently named functions is ambiguous and maps to None
+        table[key] = name if table.get(key, name) == name else None
+
+    def add(self, name, code):
+        if not code.strip():
+            return
+        tokens = normalized_tokens(code)
+        self._claim(self.exact, exact_hash(code), name)
+        self._claim(self.normalized, token_hash(tokens), name)
+        if not tokens:
+            return
+        signature = self.signature(tokens)
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(len(self.names))
+        self.names.append(name)
+        self.signatures.append(signature)
+
+    def lookup(self, code):
+        """(library name, 'exact' | 'normalized' | 'minhash', score) of a resolved function, else None"""
+        if not code.strip():
+            return None
+        name = self.exact.get(exact_hash(code))
+        if name:
+            return name, 'exact', 1.0
+        tokens = normalized_tokens(code)
+        name = self.normalized.get(token_hash(tokens))
+        if name:
+            return name, 'normalized', 1.0
+        if not tokens or self.threshold > 1:
+            return None
+        signature = self.signature(tokens)
+        candidates = {i for key in self._band_keys(signature) for i in self.buckets.get(key, ())}
+        scores = {}
+        for i in candidates:
+            score = float(np.mean(self.signatures[i] == signature))
+            scores[self.names[i]] = max(score, scores.get(self.names[i], 0.0))
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        if not ranked or ranked[0][1] < self.threshold or len(ranked) > 1 and ranked[1][1] == ranked[0][1]:
+            return None
+        return ranked[0][0], 'minhash', ranked[0][1]
+
+def load_prefilter_hits(npy_path):
+    """{test name: (library name, score)} recorded by the embedding script for a test file, empty when there is none"""
+    path = prefilter_path(npy_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {name: (hit['match'], hit['score']) for name, hit in json.load(f).items()}
+
+def main():
+    from csv_loader import iter_functions
+
+    parser = argparse.ArgumentParser(description="Measure how many test functions the fingerprint prefilter resolves",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--library_csv', required=True, help="Library functions as CSV")
+    parser.add_argument('--csv_folder', default='1_original_csv_fine_grain', help="Folder of test CSV files")
+    parser.add_argument('--threshold', type=float, default=0.9,
+                        help="Estimated Jaccard similarity for MinHash hits (above 1 disables them)")
+    args = parser.parse_args()
+
+    index = FingerprintIndex.build(((row['function_name'], row['code']) for row in iter_functions(args.library_csv)),
+                                   threshold=args.threshold)
+    print(f"Indexed {len(index.names)} library functions")
+    for csv_path in sorted(glob.glob(os.path.join(args.csv_folder, '*.csv'))):
+        counts = {'exact': [0, 0], 'normalized': [0, 0], 'minhash': [0, 0]}
+        total = 0
+        for row in iter_functions(csv_path):
+            total += 1
+            hit = index.lookup(row['code'])
+            if hit:
+                counts[hit[1]][0] += 1
+                counts[hit[1]][1] += hit[0] == row['function_name']
+        print(f"{os.path.basename(csv_path)}: {sum(c[0] for c in counts.values())}/{total} resolved, " + ", ".join(
+            f"{kind} {resolved} ({correct} correct)" for kind, (resolved, correct) in counts.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import csv
+import argparse
+import glob
+import time
+import numpy as np
+from code_embedder import add_embedder_arguments, embedder_from_args
+from code_folding import FOLDING_STRATEGIES, SimpleCodeFolder
+from csv_loader import iter_functions
+from embedding_io import load_embedding_matrix
+from vector_search import normalize_rows, top_k_search
+
+def read_functions(csv_path):
+    """(function_name, code) pairs of a CSV in the 1_original_csv_fine_grain format"""
+    return [(row['function_name'], row['code']) for row in iter_functions(csv_path)]
+
+def fold_stats(embedder, codes, token_ids):
+    """Fold the functions that do not fit, returns the folded ids and the token statistics of the long ones"""
+    limit = embedder.max_tokens - 2
+    start = time.time()
+    folded_ids = embedder.fold_long(codes, token_ids)
+    elapsed = time.time() - start
+    long_rows = [i for i, ids in enumerate(token_ids) if len(ids) > limit]
+    before = sum(len(token_ids[i]) for i in long_rows)
+    after = sum(len(folded_ids[i]) for i in long_rows)
+    return folded_ids, {
+        'long': len(long_rows),
+        'reduction': 1 - after / before if before else 0.0,
+        'fit': sum(len(folded_ids[i]) <= limit for i in long_rows) / len(long_rows) if long_rows else 1.0,
+        'fold_s': elapsed,
+    }
+
+def detection_rates(test_matrix, test_names, library_normed, library_names, k=5):
+
+    indices, _ = top_k_search(normalize_rows(test_matrix), library_normed, k)
+    rates = []
+    for top in (1, 3, 5):
+        hits = sum(name in {library_names[i] for i in row[:top]} for name, row in zip(test_names, indices.tolist()))
+        rates.append(hits / max(1, len(test_names)))
+    return rates
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare token reduction and detection rate of the folding strategies",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--csv_folder', default='1_original_csv_fine_grain', help="Folder of test CSV files")
+    parser.add_argument('--library_path', default='function_library_embeddings.npy',
+                        help="Library embeddings, used as is for every strategy")
+    parser.add_argument('--library_csv', default=None,
+                        help="Library functions as CSV, re-embedded with each strategy instead of --library_path")
+    parser.add_argument('--strategies', nargs='+', choices=FOLDING_STRATEGIES, default=list(FOLDING_STRATEGIES),
+                        help="Folding strategies to compare, each used in place of --folding")
+    parser.add_argument('--output', default='folding_benchmark.csv', help="CSV file for the comparison table")
+    add_embedder_arguments(parser)
+    args = parser.parse_args()
+
+    embedder = embedder_from_args(args)
+    tests = [(os.path.basename(path), read_functions(path)) for path in sorted(glob.glob(os.path.join(args.csv_folder, '*.csv')))]
+    test_ids = [embedder.tokenize([code for _, code in functions]) for _, functions in tests]
+    if args.library_csv:
+        library = read_functions(args.library_csv)
+        library_names = [name for name, _ in library]
+        library_ids = embedder.tokenize([code for _, code in library])
+    else:
+        library_names, library_matrix = load_embedding_matrix(args.library_path)
+        library_normed = normalize_rows(library_matrix)
+
+    rows = []
+    for strategy in args.strategies:
+        print(f"\n=== Folding strategy: {strategy} ===")
+        embedder.folder = SimpleCodeFolder(embedder.tokenizer, max_tokens=embedder.max_tokens - 2, strategy=strategy)
+        if args.library_csv:
+            folded, _ = fold_stats(embedder, [code for _, code in library], library_ids)
+            library_normed = normalize_rows(embedder.embed_ids(folded))
+        for (file_name, functions), token_ids in zip(tests, test_ids):
+            codes = [code for _, code in functions]
+            folded, stats = fold_stats(embedder, codes, token_ids)
+            top1, top3, top5 = detection_rates(embedder.embed_ids(folded), [name for name, _ in functions],
+                                               library_normed, library_names)
+            rows.append({'strategy': strategy, 'file': file_name, 'functions': len(functions), **stats,
+                         'top-1': top1, 'top-3': top3, 'top-5': top5})
+            print(f"  {file_name}: {stats['long']} long functions, {stats['reduction']:.1%} token reduction, "
+                  f"{stats['fit']:.1%} fit after folding ({stats['fold_s']:.1f}s), "
+                  f"Top-1 {top1:.2%}, Top-3 {top3:.2%}, Top-5 {top5:.2%}")
+
+    print("\n=== Summary (averaged over files) ===")
+    print(f"{'strategy':<16}{'reduction':>10}{'fit':>8}{'top-1':>8}{'top-3':>8}{'top-5':>8}")
+    for strategy in args.strategies:
+        picked = [row for row in rows if row['strategy'] == strategy]
+        if not picked:
+            continue
+        mean = {key: np.mean([row[key] for row in picked]) for key in ('reduction', 'fit', 'top-1', 'top-3', 'top-5')}
+        print(f"{strategy:<16}{mean['reduction']:>10.1%}{mean['fit']:>8.1%}"
+              f"{mean['top-1']:>8.2%}{mean['top-3']:>8.2%}{mean['top-5']:>8.2%}")
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['strategy'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nBenchmark table saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
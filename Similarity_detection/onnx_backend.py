@@ -0,0 +1,174 @@
+import os
+import argparse
+import glob
+import inspect
+import json
+import re
+import time
+import numpy as np
+
+ONNX_BACKENDS = ('onnx', 'onnx-int8')
+DEFAULT_ONNX_DIR = 'onnx_models'
+MIN_PARITY_COSINE = 0.99
+OPSET = 17
+
+def onnx_model_path(model_path, onnx_dir=DEFAULT_ONNX_DIR, backend='onnx'):
+    """Exported model file for a model name or path: microsoft/graphcodebert-base -> onnx_models/microsoft_graphcodebert-base.int8.onnx"""
+    name = re.sub(r'[^\w.-]+', '_', model_path.strip('/\\'))
+    return os.path.join(onnx_dir, f"{name}.{'int8' if backend == 'onnx-int8' else 'fp32'}.onnx")
+
+def default_threads():
+    """Threads for one inference session: all cores, since sequences are batched rather than run in parallel"""
+    return max(1, len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1)
+
+def export_onnx(model_path, onnx_path, example_length=16):
+    """Export the encoder to ONNX with dynamic batch and sequence axes; the graph outputs only the CLS vector"""
+    import torch
+    from transformers import AutoModel
+
+    # Eager attention traces to plain MatMul/Softmax ops that onnxruntime fuses and quantizes well
+    model = AutoModel.from_pretrained(model_path, attn_implementation='eager')
+    model.eval()
+
+    class ClsEncoder(torch.nn.Module):
+
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask):
+            return self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state[:, 0, :]
+
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    # Unpadded example inputs, padded ones can get their mask handling traced as constants
+    input_ids = torch.full((2, example_length), model.config.pad_token_id + 1, dtype=torch.long)
+    attention_mask = torch.ones_like(input_ids)
+    axes = {0: 'batch', 1: 'sequence'}
+    # Newer torch defaults to the dynamo exporter; older releases such as 1.13 have no such keyword
+    extra = {'dynamo': False} if 'dynamo' in inspect.signature(torch.onnx.export).parameters else {}
+    torch.onnx.export(ClsEncoder(model), (input_ids, attention_mask), onnx_path,
+                      input_names=['input_ids', 'attention_mask'], output_names=['cls'],
+                      dynamic_axes={'input_ids': axes, 'attention_mask': axes, 'cls': {0: 'batch'}},
+                      opset_version=OPSET, **extra)
+
+def quantize_onnx(onnx_path, int8_path):
+    """Dynamic int8 quantization of the weights of an exported model; activations are quantized at run time"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+
+def load_or_export(model_path, onnx_dir=DEFAULT_ONNX_DIR, backend='onnx', rebuild=False, source_path=None):
+    """Path of the exported (and for onnx-int8 quantized) model, exporting it on first use.
+
+    The file is named after model_path; the weights are read from
+    source_path, such as a local snapshot of the model, when it is given.
+    """
+    fp32_path = onnx_model_path(model_path, onnx_dir, 'onnx')
+    path = onnx_model_path(model_path, onnx_dir, backend)
+    if os.path.exists(path) and not rebuild:
+        return path
+    start = time.time()
+    if rebuild or not os.path.exists(fp32_path):
+        export_onnx(source_path or model_path, fp32_path)
+    if backend == 'onnx-int8':
+        quantize_onnx(fp32_path, path)
+    print(f"Exported {model_path} to {path} in {time.time() - start:.1f}s")
+    return path
+
+class OnnxEncoder:
+    """onnxruntime CPU session of an exported encoder, called with padded numpy batches.
+
+    intra_op_threads parallelizes each matrix multiply; inter_op_threads
+    only helps graphs with independent branches, which a BERT encoder does
+    not have, so it defaults to 1 with sequential execution.
+    """
+
+    def __init__(self, onnx_path, intra_op_threads=0, inter_op_threads=1):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or default_threads()
+        options.inter_op_num_threads = max(1, inter_op_threads)
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, input_ids, attention_mask):
+        feed = {'input_ids': input_ids.astype(np.int64), 'attention_mask': attention_mask.astype(np.int64)}
+        return self.session.run(['cls'], feed)[0].astype(np.float32)
+
+def cosine_rows(a, b):
+    """Cosine similarity of matching rows; rows that are zero in both count as identical"""
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    dots = (a * b).sum(axis=1)
+    return np.where(norms > 0, dots / np.where(norms > 0, norms, 1), 1.0)
+
+def parity_check(reference, candidate, codes):
+    """Compare the embeddings of two CodeEmbedders on the same functions, returns cosine statistics"""
+    cosines = cosine_rows(reference.embed(codes), candidate.embed(codes))
+    return {'functions': len(codes), 'min': float(cosines.min()) if len(codes) else 1.0,
+            'mean': float(cosines.mean()) if len(codes) else 1.0, 'passed': bool((cosines >= MIN_PARITY_COSINE).all())}
+
+def throughput(embedder, codes, repeats=1):
+    """Functions per second of embedder.embed over codes, after one warm-up batch"""
+    embedder.embed(codes[:embedder.batch_size])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embedder.embed(codes)
+    return len(codes) * repeats / max(time.perf_counter() - start, 1e-9)
+
+def read_codes(csv_folder, limit):
+
+    from csv_loader import iter_functions
+    codes = []
+    for path in sorted(glob.glob(os.path.join(csv_folder, '*.csv'))):
+        codes += [row['code'] for row in iter_functions(path)]
+        if len(codes) >= limit:
+            break
+    return codes[:limit]
+
+def main():
+    from code_embedder import CodeEmbedder, DEFAULT_MODEL_PATH, local_snapshot
+
+    parser = argparse.ArgumentParser(description="Export GraphCodeBERT to ONNX, check parity with PyTorch and compare CPU throughput",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--csv_folder', default='1_original_csv_fine_grain', help="Folder of CSV files to embed")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="Model name or local path")
+    parser.add_argument('--onnx_dir', default=DEFAULT_ONNX_DIR, help="Folder of exported models")
+    parser.add_argument('--backends', nargs='+', choices=ONNX_BACKENDS, default=list(ONNX_BACKENDS),
+                        help="ONNX variants compared with PyTorch")
+    parser.add_argument('--rebuild', action='store_true', help="Export again even if the ONNX files exist")
+    parser.add_argument('--intra_op_threads', type=int, default=0, help="onnxruntime threads per operator, 0 uses all cores")
+    parser.add_argument('--inter_op_threads', type=int, default=1, help="onnxruntime threads across operators")
+    parser.add_argument('--batch_size', type=int, default=32, help="Functions per forward pass")
+    parser.add_argument('--max_tokens', type=int, default=512, help="Token limit after folding")
+    parser.add_argument('--limit', type=int, default=256, help="Functions used for the parity check and the benchmark")
+    parser.add_argument('--repeats', type=int, default=1, help="Timed passes over the functions")
+    args = parser.parse_args()
+
+    codes = read_codes(args.csv_folder, args.limit)
+    if not codes:
+        print(f"No functions found in {args.csv_folder}")
+        return
+    torch_embedder = CodeEmbedder(args.model, 'cpu', args.max_tokens, args.batch_size)
+    results = {'pytorch': {'functions_per_s': throughput(torch_embedder, codes, args.repeats)}}
+    print(f"pytorch: {results['pytorch']['functions_per_s']:.1f} functions/s on {len(codes)} functions")
+    for backend in args.backends:
+        load_or_export(args.model, args.onnx_dir, backend, args.rebuild, local_snapshot(args.model))
+        embedder = CodeEmbedder(args.model, 'cpu', args.max_tokens, args.batch_size, backend=backend,
+                                onnx_dir=args.onnx_dir, intra_op_threads=args.intra_op_threads,
+                                inter_op_threads=args.inter_op_threads)
+        parity = parity_check(torch_embedder, embedder, codes)
+        speed = throughput(embedder, codes, args.repeats)
+        results[backend] = {'functions_per_s': speed, 'parity': parity,
+                            'model_mb': os.path.getsize(embedder.encoder.onnx_path) / 1024 / 1024}
+        print(f"{backend}: {speed:.1f} functions/s ({speed / results['pytorch']['functions_per_s']:.2f}x pytorch), "
+              f"{results[backend]['model_mb']:.0f} MB, cosine vs pytorch min {parity['min']:.4f} mean {parity['mean']:.4f} "
+              f"-> {'PASS' if parity['passed'] else 'FAIL'} (>= {MIN_PARITY_COSINE})")
+
+    report_path = os.path.join(args.onnx_dir, 'benchmark.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Benchmark saved to {report_path}")
+
+if __name__ == '__main__':
+    main()
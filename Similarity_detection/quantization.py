@@ -0,0 +1,162 @@
+import os
+import time
+import numpy as np
+from vector_search import iter_blocks, top_k_search
+
+QUANT_MODES = ('fp32', 'fp16', 'int8', 'pq')
+
+def quantized_path(library_path, mode):
+    """Quantized library stored next to the library: lib_embeddings.npy -> lib_embeddings.int8.npz"""
+    return os.path.splitext(library_path)[0] + f'.{mode}.npz'
+
+def quantize_int8(normed):
+    """Symmetric per-row int8 codes and float32 scales of L2-normalized rows"""
+    scales = np.abs(normed).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(normed / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _pq_subspaces(dim, m):
+
+    m = max(1, min(m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+def _kmeans(x, k, iters=15, seed=0):
+
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+def _nearest(x, centroids, chunk_size=65536):
+
+    assign = np.empty(len(x), dtype=np.int64)
+    c_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(x), chunk_size):
+        block = x[start:start + chunk_size]
+        assign[start:start + chunk_size] = (c_norms[None, :] - 2 * block @ centroids.T).argmin(axis=1)
+    return assign
+
+class QuantizedLibrary:
+    """An L2-normalized library held in reduced precision and searched without decompressing it.
+
+    fp16 halves and int8 quarters the memory of float32 vectors. pq keeps
+    one byte per sub-vector (96 bytes for 768-d vectors) and scores queries
+    with asymmetric distance tables.
+    """
+
+    def __init__(self, mode, arrays):
+        self.mode = mode
+        self.arrays = arrays
+        if mode == 'pq':
+            self.shape = (arrays['codes'].shape[0], arrays['centroids'].shape[0] * arrays['centroids'].shape[2])
+        else:
+            self.shape = arrays['codes'].shape
+
+    @classmethod
+    def build(cls, mode, normed, pq_m=96, pq_train=20000, seed=0):
+        """Quantize an L2-normalized matrix or NormalizedRows view block by block"""
+        n, dim = normed.shape
+        if mode in ('fp32', 'fp16'):
+            codes = np.empty((n, dim), dtype=np.float32 if mode == 'fp32' else np.float16)
+            for start, block in iter_blocks(normed):
+                codes[start:start + len(block)] = block
+            return cls(mode, {'codes': codes})
+        if mode == 'int8':
+            codes = np.empty((n, dim), dtype=np.int8)
+            scales = np.empty(n, dtype=np.float32)
+            for start, block in iter_blocks(normed):
+                codes[start:start + len(block)], scales[start:start + len(block)] = quantize_int8(block)
+            return cls(mode, {'codes': codes, 'scales': scales})
+        if mode != 'pq':
+            raise ValueError(f"Unknown quantization mode {mode}, expected one of {QUANT_MODES}")
+
+        m = _pq_subspaces(dim, pq_m)
+        dsub = dim // m
+        k = min(256, n)
+        rng = np.random.default_rng(seed)
+        train = normed[rng.choice(n, pq_train, replace=False)] if n > pq_train else normed[0:n]
+        train = np.asarray(train, dtype=np.float32)
+        centroids = np.empty((m, k, dsub), dtype=np.float32)
+        for j in range(m):
+            centroids[j] = _kmeans(np.ascontiguousarray(train[:, j * dsub:(j + 1) * dsub]), k, seed=seed + j)
+        codes = np.empty((n, m), dtype=np.uint8)
+        for start, block in iter_blocks(normed):
+            for j in range(m):
+                codes[start:start + len(block), j] = _nearest(np.ascontiguousarray(block[:, j * dsub:(j + 1) * dsub]),
+                                                              centroids[j])
+        return cls(mode, {'codes': codes, 'centroids': centroids})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            mode = str(data['mode'])
+            arrays = {key: data[key] for key in data.files if key not in ('mode', 'meta')}
+        return cls(mode, arrays)
+
+    def save(self, path, meta):
+        np.savez(path, mode=np.array(self.mode), meta=np.array(meta), **self.arrays)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def quantize_queries(self, queries):
+        """Round-trip queries through the same storage precision (pq queries stay float32)"""
+        if self.mode == 'fp16':
+            return queries.astype(np.float16).astype(np.float32)
+        if self.mode == 'int8':
+            codes, scales = quantize_int8(queries)
+            return codes.astype(np.float32) * scales[:, None]
+        return queries
+
+    def scores(self, queries, block_size=65536):
+        """Similarities of float32 queries against every library row, (n_queries, n_library)"""
+        codes = self.arrays['codes']
+        if self.mode == 'pq':
+            centroids = self.arrays['centroids']
+            m, _, dsub = centroids.shape
+            tables = np.einsum('qmd,mkd->qmk', queries.reshape(len(queries), m, dsub), centroids)
+            sims = np.zeros((len(queries), codes.shape[0]), dtype=np.float32)
+            for j in range(m):
+                sims += tables[:, j, :][:, codes[:, j]]
+            return sims
+        sims = np.empty((len(queries), codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], block_size):
+            block = codes[start:start + block_size].astype(np.float32)
+            sims[:, start:start + block_size] = queries @ block.T
+        if self.mode == 'int8':
+            sims *= self.arrays['scales'][None, :]
+        return sims
+
+    def search(self, queries, k=5, max_scores=None):
+        """Same contract as vector_search.top_k_search, scored against the quantized library"""
+        queries = np.ascontiguousarray(self.quantize_queries(queries), dtype=np.float32)
+        kwargs = {'max_scores': max_scores} if max_scores else {}
+        return top_k_search(queries, self, k, score_fn=self.scores, **kwargs)
+
+def load_or_build_quantized(library_path, normed, mode, pq_m=96, rebuild=False):
+    """Load the persisted quantized library, building and saving it when missing or stale"""
+    path = quantized_path(library_path, mode)
+    meta = f"{mode}|{normed.shape[0]}|{normed.shape[1]}|{pq_m}|{os.path.getmtime(library_path)}"
+    if not rebuild and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as data:
+            current = str(data['meta']) == meta
+        if current:
+            print(f"Loaded {mode} library from {path}")
+            return QuantizedLibrary.load(path)
+
+    start = time.time()
+    library = QuantizedLibrary.build(mode, normed, pq_m)
+    library.save(path, meta)
+    print(f"Built {mode} library ({library.nbytes / 1024 / 1024:.1f} MB vs {normed.nbytes / 1024 / 1024:.1f} MB float32) "
+          f"in {time.time() - start:.1f}s, saved to {path}")
+    return library
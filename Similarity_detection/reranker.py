@@ -0,0 +1,101 @@
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+SIMILARITY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Code_Similarity_Evaluate', 'similarity.py')
+RERANK_METRICS = ('interface', 'structure', 'control_flow', 'halstead', 'token_edit')
+
+_similarity = None
+_state = {}
+
+def load_similarity():
+    """similarity.py of Code_Similarity_Evaluate, imported from its path"""
+    global _similarity
+    if _similarity is None:
+        spec = importlib.util.spec_from_file_location('similarity', SIMILARITY_PATH)
+        _similarity = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_similarity)
+    return _similarity
+
+def load_codes(csv_path):
+    """{function name: code} of a function CSV; a repeated name keeps its last code, as the embedding files do"""
+    from csv_loader import iter_functions
+    return {row['function_name']: row['code'] for row in iter_functions(csv_path)}
+
+def test_csv_path(csv_folder, test_file):
+    """CSV a test embedding file was made from: x_embeddings.npy -> csv_folder/x.csv"""
+    return os.path.join(csv_folder, test_file.replace('_embeddings.npy', '.csv'))
+
+def _features(code, metrics):
+    try:
+        return load_similarity().extract_features(code, metrics)
+    except Exception:
+        # Functions the metrics fail on score 0, as in evaluate_file_pair
+        return None
+
+def _init_worker(library_codes, metrics):
+    _state.update(library=library_codes, metrics=metrics, cache={})
+    load_similarity()
+
+def _score_query(query):
+    test_code, names = query
+    similarity = load_similarity()
+    metrics, cache = _state['metrics'], _state['cache']
+    test_features = _features(test_code, metrics)
+    scores = []
+    for name in names:
+        if name not in cache:
+            code = _state['library'].get(name)
+            cache[name] = _features(code, metrics) if code is not None else None
+        if test_features is None or cache[name] is None:
+            scores.append(0.0)
+            continue
+        try:
+            scores.append(float(similarity.weighted_similarity(
+                similarity.compare_features(cache[name], test_features, metrics))))
+        except Exception:
+            scores.append(0.0)
+    return scores
+
+class Reranker:
+    """Second retrieval stage that re-orders the embedding top-K of each test function by structural similarity.
+
+    Candidates are scored with the chosen metrics of
+    evaluate_function_similarity in similarity.py, averaged with their
+    weights rescaled to the subset, and ranked by
+    (1 - weight) * cosine + weight * structural score. Queries are spread
+    over worker processes, each of which parses a library function once
+    and keeps its features for later queries. With workers=0 everything
+    runs in the calling process.
+    """
+
+    def __init__(self, library_codes, metrics=RERANK_METRICS, weight=0.5, workers=0):
+        self.metrics = tuple(metrics)
+        self.weight = weight
+        self.workers = workers
+        self.pool = None
+        if workers > 0:
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(library_codes, self.metrics))
+        else:
+            _init_worker(library_codes, self.metrics)
+
+    def rerank(self, test_codes, top_k_lists):
+        """Re-ordered (name, combined score) lists; test functions without code keep their embedding ranking"""
+        todo = [i for i, code in enumerate(test_codes) if code is not None and top_k_lists[i]]
+        queries = [(test_codes[i], [name for name, _ in top_k_lists[i]]) for i in todo]
+        if self.pool:
+            results = self.pool.map(_score_query, queries, chunksize=max(1, len(queries) // (self.workers * 4)))
+        else:
+            results = map(_score_query, queries)
+        reranked = list(top_k_lists)
+        for i, scores in zip(todo, results):
+            combined = [(name, (1 - self.weight) * cosine + self.weight * score)
+                        for (name, cosine), score in zip(top_k_lists[i], scores)]
+            reranked[i] = sorted(combined, key=lambda item: -item[1])
+        return reranked
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
@@ -0,0 +1,37 @@
+import codecs
+from csv_loader import LoadReport, iter_functions, sniff_encoding
+
+HEADER = 'id,function_name,code\r\n'
+
+def write_csv(path, text, encoding):
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+def test_utf8_with_bom(tmp_path):
+    path = str(tmp_path / 'o1.csv')
+    with open(path, 'wb') as f:
+        f.write(codecs.BOM_UTF8 + (HEADER + '1,f,"int f() {\\n  return \'é\';\\n}"\r\n').encode('utf-8'))
+    assert sniff_encoding(path) == 'utf-8-sig'
+    assert list(iter_functions(path)) == [{'id': '1', 'function_name': 'f', 'code': "int f() {\n  return 'é';\n}"}]
+
+def test_undecodable_bytes_fall_back_to_latin1(tmp_path):
+    path = write_csv(tmp_path / 'o1.csv', HEADER + '1,f,"char *s = ""caf\xe9"";"\r\n', 'latin-1')
+    report = LoadReport(path)
+    rows = list(iter_functions(path, report))
+    assert report.encoding == 'latin-1'
+    assert rows[0]['code'] == 'char *s = "café";'
+    assert report.replaced == 0
+
+def test_multibyte_character_cut_by_the_sniffed_prefix(tmp_path):
+    text = HEADER + '1,f,"/* é */"\r\n'
+    path = write_csv(tmp_path / 'o1.csv', text, 'utf-8')
+    # The prefix ends after the first byte of the two-byte é
+    assert sniff_encoding(path, prefix_bytes=len(text.encode('utf-8').split('é'.encode('utf-8'))[0]) + 1) == 'utf-8'
+
+def test_rows_with_wrong_columns_are_reported(tmp_path):
+    path = write_csv(tmp_path / 'o1.csv', HEADER + '1,f,"int f();"\r\n2,g\r\n3,h,"int h();",extra\r\n', 'utf-8')
+    report = LoadReport(path)
+    assert [row['function_name'] for row in iter_functions(path, report)] == ['f']
+    assert report.accepted == 1
+    assert report.rejected == {'2 columns': 1, '4 columns': 1}
+    assert report.examples == {'2 columns': [3], '4 columns': [4]}
@@ -0,0 +1,51 @@
+from fingerprint import FingerprintIndex, normalized_tokens
+
+COPY = """int copy_block(char *dst, const char *src, int len)
+{
+    int i;
+    if (len <= 0)
+        return 0;
+    for (i = 0; i < len; i++) {
+        if (src[i] == 0)
+            break;
+        dst[i] = src[i] ^ 0x5a;
+    }
+    dst[i] = 0;
+    checksum_update(dst, i);
+    log_event(3, dst, i);
+    flush_buffer(dst, i, len);
+    return i;
+}"""
+
+PARSE = """int parse_header(unsigned char *buf, unsigned int size)
+{
+    unsigned int magic = buf[0] | buf[1] << 8;
+    if (magic != 0x4d42 || size < 54)
+        return -1;
+    return buf[10] | buf[11] << 8 | buf[12] << 16 | buf[13] << 24;
+}"""
+
+def build_index(**kwargs):
+    return FingerprintIndex.build([('copy_block', COPY), ('parse_header', PARSE)], **kwargs)
+
+def test_exact_hit_ignores_layout():
+    assert build_index().lookup('  ' + COPY.replace('\n    ', '\n\t')) == ('copy_block', 'exact', 1.0)
+
+def test_normalized_hit_ignores_renamed_variables():
+    renamed = COPY.replace('dst', 'a1').replace('src', 'a2').replace('len', 'a3').replace('copy_block', 'sub_401000')
+    assert build_index().lookup(renamed) == ('copy_block', 'normalized', 1.0)
+
+def test_minhash_hit_on_a_near_duplicate():
+    changed = COPY.replace('0x5a', '0x5b').replace('log_event(3', 'log_event(4')
+    name, kind, score = build_index(threshold=0.8).lookup(changed)
+    assert (name, kind) == ('copy_block', 'minhash')
+    assert 0.8 <= score < 1.0
+
+def test_unrelated_or_ambiguous_code_is_not_resolved():
+    assert build_index().lookup('void nop(void) { }') is None
+    ambiguous = FingerprintIndex.build([('copy_a', COPY), ('copy_b', COPY), ('parse_header', PARSE)])
+    assert ambiguous.lookup(COPY) is None
+
+def test_called_functions_keep_their_names():
+    assert normalized_tokens(COPY) != normalized_tokens(COPY.replace('checksum_update', 'checksum_reset'))
+    assert build_index().lookup(COPY.replace('checksum_update', 'checksum_reset'))[1] != 'normalized'
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from vector_search import NormalizedRows, normalize_rows, top_k_search
+
+cdist = pytest.importorskip('scipy.spatial.distance').cdist
+
+def baseline_top_k(queries, library, k):
+    """Ranking of the original 2-detection.py: 1 - scipy cosine distance, sorted in decreasing order"""
+    sims = 1 - cdist(queries, library, 'cosine')
+    order = np.argsort(-sims, axis=1, kind='stable')[:, :k]
+    return order, np.take_along_axis(sims, order, axis=1)
+
+def test_top_k_matches_the_cdist_ranking():
+    rng = np.random.default_rng(0)
+    library = rng.standard_normal((500, 32)).astype(np.float32)
+    queries = rng.standard_normal((40, 32)).astype(np.float32)
+    expected_indices, expected_scores = baseline_top_k(queries, library, 5)
+    # max_scores forces several query chunks, chunk_size several library blocks
+    for normed in (normalize_rows(library), NormalizedRows(library, chunk_size=64)):
+        indices, scores = top_k_search(normalize_rows(queries), normed, k=5, max_scores=1000)
+        assert (indices == expected_indices).all()
+        np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+
+def test_k_larger_than_the_library():
+    rng = np.random.default_rng(1)
+    library = rng.standard_normal((3, 8)).astype(np.float32)
+    queries = rng.standard_normal((2, 8)).astype(np.float32)
+    indices, scores = top_k_search(normalize_rows(queries), normalize_rows(library), k=5)
+    assert indices.shape == (2, 3)
+    assert (indices == baseline_top_k(queries, library, 3)[0]).all()
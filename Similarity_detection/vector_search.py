@@ -0,0 +1,85 @@
+import numpy as np
+
+DEFAULT_MAX_SCORES = 16 * 1024 * 1024
+
+def normalize_rows(matrix, chunk_size=65536):
+    """L2-normalized float32 copy of an (n, dim) matrix, converted in chunks; zero rows stay zero"""
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    normed = np.empty(matrix.shape, dtype=np.float32)
+    for start in range(0, matrix.shape[0], chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        normed[start:start + chunk_size] = block / norms
+    return normed
+
+def iter_blocks(rows, chunk_size=16384):
+    """(start, float32 block) pairs over the rows of a matrix or NormalizedRows view"""
+    for start in range(0, rows.shape[0], chunk_size):
+        yield start, np.asarray(rows[start:start + chunk_size], dtype=np.float32)
+
+class NormalizedRows:
+    """Read-only view of an (n, dim) matrix, usually memory-mapped, whose rows are L2-normalized as they are read.
+
+    Quantizers and ANN indexes are built and re-scored from this view, so
+    a library never needs a second, normalized float32 copy in memory.
+    """
+
+    def __init__(self, matrix, chunk_size=16384):
+        self.matrix = matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+        self.shape = self.matrix.shape
+        self.chunk_size = chunk_size
+
+    @property
+    def nbytes(self):
+        # Size the normalized float32 library would have
+        return self.shape[0] * self.shape[1] * 4
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            return normalize_rows(self.matrix[rows])
+        rows = np.asarray(rows)
+        return normalize_rows(self.matrix[rows.ravel()]).reshape(rows.shape + (self.shape[1],))
+
+    def scores(self, queries):
+        """Similarities of L2-normalized queries against every row, normalizing one block of rows at a time"""
+        sims = np.empty((len(queries), self.shape[0]), dtype=np.float32)
+        for start, block in iter_blocks(self, self.chunk_size):
+            sims[:, start:start + len(block)] = queries @ block.T
+        return sims
+
+def select_top_k(sims, k):
+    """Indices and values of the k largest entries of every row of sims, sorted by decreasing value"""
+    if k < sims.shape[1]:
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+def top_k_search(queries, library, k=5, max_scores=DEFAULT_MAX_SCORES, score_fn=None):
+    """Cosine top-k of every query row against L2-normalized library rows.
+
+    queries must be L2-normalized too. Queries are scored in chunks so at most
+    max_scores similarities are held at once. score_fn(query_chunk) replaces
+    the plain matrix multiply, e.g. for quantized libraries; a NormalizedRows
+    library is scored with its own scores(). Returns
+    (indices, scores), both (n_queries, k) and sorted by decreasing similarity.
+    """
+    k = min(k, library.shape[0])
+    n = queries.shape[0]
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+
+    if score_fn is None and isinstance(library, NormalizedRows):
+        score_fn = library.scores
+    chunk_size = max(1, max_scores // max(1, library.shape[0]))
+    for start in range(0, n, chunk_size):
+        chunk = queries[start:start + chunk_size]
+        sims = score_fn(chunk) if score_fn is not None else chunk @ library.T
+        indices[start:start + chunk_size], scores[start:start + chunk_size] = select_top_k(sims, k)
+    return indices, scores